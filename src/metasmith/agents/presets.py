@@ -9,6 +9,7 @@ import yaml
 import time
 
 from ..hashing import KeyGenerator
+from ..serialization import YamlLoader
 from ..coms.ipc import LiveShell, ShellResult, RemoveLeadingIndent
 from ..logging import Log
 from ..coms.containers import Container, CONTAINER_RUNTIME
@@ -43,7 +44,7 @@ class Agent:
     @classmethod
     def Load(cls, file_path: Path):
         with open(file_path, "r") as f:
-            data = yaml.safe_load(f)
+            data = yaml.load(f, Loader=YamlLoader)
         return cls.Unpack(data)
 
     def RunSetup(self, shell: LiveShell, timeout: int = None):
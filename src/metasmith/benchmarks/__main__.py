@@ -0,0 +1,77 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from ..constants import VERSION
+from ..models.solver import PlanningMode
+from .solver import DefaultSuite, GENERATORS, Run, Allocation, Optimality, FanIn, Diamond, Branches
+from .ids import Ids
+
+def _commit():
+    try:
+        res = subprocess.run(["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True)
+        return res.stdout.strip() if res.returncode == 0 else None
+    except FileNotFoundError:
+        return None
+
+def main(raw_args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m metasmith.benchmarks",
+        description="Time the planner on synthetic transform libraries and report as json",
+    )
+    parser.add_argument("--workloads", nargs="*", choices=list(GENERATORS), default=None, help="subset of workloads to run, all by default")
+    parser.add_argument("--modes", nargs="*", choices=[m.value for m in PlanningMode], default=[m.value for m in PlanningMode])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=None, help="passed to the DFS planner")
+    parser.add_argument("--memo-limit", type=int, default=None, help="bytes of memo tables kept by the planners")
+    parser.add_argument("--workers", type=int, default=None, help="processes for the DFS planner to search the target's requirements in")
+    parser.add_argument("--nodes", type=int, default=0, help="also time building this many endpoints, see Allocation")
+    parser.add_argument("--ids", type=int, default=0, help="also time drawing this many message ids, see Ids")
+    parser.add_argument("--check", action="store_true", help="also check that best first plans are as cheap as the DFS finds, see Optimality")
+    parser.add_argument("--out", metavar="json", default=None, help="write results here instead of stdout")
+    args = parser.parse_args(raw_args)
+
+    results = []
+    for workload in DefaultSuite():
+        if args.workloads is not None and workload.name not in args.workloads: continue
+        for mode in args.modes:
+            mode = PlanningMode(mode)
+            params = dict(top_k=args.top_k, workers=args.workers) if mode == PlanningMode.DFS else dict()
+            if args.memo_limit is not None: params.update(memo_limit=args.memo_limit)
+            r = Run(workload, mode=mode, repeats=args.repeats, **params)
+            print(f"{r['workload']} {r['params']} {r['mode']}: {r['wall_time']:.4f}s, memo {r['stats']['memo_bytes']}B", file=sys.stderr)
+            results.append(r)
+
+    allocation = None
+    if args.nodes > 0:
+        allocation = Allocation(args.nodes)
+        print(f"allocation {args.nodes}: {allocation['wall_time']:.4f}s, {allocation['bytes_per_node']:.0f}B per node", file=sys.stderr)
+
+    ids = None
+    if args.ids > 0:
+        ids = Ids(args.ids, repeats=args.repeats)
+        print(f"ids {args.ids}: {ids['numpy_time']:.4f}s with numpy, {ids['pool_time']:.4f}s from the pool", file=sys.stderr)
+
+    optimality = None
+    if args.check:
+        optimality = [Optimality(w) for w in [FanIn(3, 2), FanIn(4, 3), Diamond(4), Branches(2, 2, 2)]]
+        print(f"optimality: checked [{len(optimality)}] workloads", file=sys.stderr)
+
+    report = json.dumps(dict(
+        version=VERSION,
+        commit=_commit(),
+        results=results,
+        allocation=allocation,
+        ids=ids,
+        optimality=optimality,
+    ), indent=2)
+    if args.out is None:
+        print(report)
+    else:
+        with open(args.out, "w") as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
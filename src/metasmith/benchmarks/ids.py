@@ -0,0 +1,27 @@
+from __future__ import annotations
+import time
+
+from ..hashing import KeyGenerator, UIDPool
+
+# ids of ipc messages, drawn one at a time as each message is made
+def Ids(count: int=100_000, length: int=12, repeats: int=3):
+    generator = KeyGenerator()
+    pool = UIDPool()
+    def _time(draw):
+        times = []
+        for _ in range(max(1, repeats)):
+            t0 = time.perf_counter()
+            for _ in range(count):
+                draw(length)
+            times.append(time.perf_counter()-t0)
+        return min(times)
+
+    numpy_time = _time(generator.GenerateUID)
+    pool_time = _time(pool.Take)
+    return dict(
+        count=count,
+        length=length,
+        numpy_time=numpy_time,
+        pool_time=pool_time,
+        speedup=numpy_time/pool_time if pool_time > 0 else None,
+    )
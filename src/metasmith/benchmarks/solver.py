@@ -0,0 +1,200 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Callable
+import time
+import tracemalloc
+
+from ..models.solver import Endpoint, Transform, PlanningMode, PlanObjective, PlanCost, SolverStats
+from ..models.solver import ProducerIndex, _solve_by_bounded_dfs, _solve_best_first
+
+# a synthetic planning problem
+@dataclass
+class Workload:
+    name: str
+    given: list[Endpoint]
+    target: Transform
+    transforms: list[Transform]
+    params: dict = field(default_factory=dict)
+
+def _transform(requires: list[set[str]], produces: list[set[str]]):
+    t = Transform()
+    for r in requires:
+        t.AddRequirement(properties=r)
+    for p in produces:
+        t.AddProduct(properties=p)
+    return t
+
+def Chain(length: int=16):
+    """a0 -> a1 -> ... -> a{length}"""
+    transforms = [_transform([{f"a{i}"}], [{f"a{i+1}"}]) for i in range(length)]
+    target = _transform([{f"a{length}"}], [])
+    return Workload("chain", [Endpoint({"a0"})], target, transforms, dict(length=length))
+
+def Diamond(width: int=8):
+    """source -> {branch_i} -> join, where the join needs every branch from the same source"""
+    transforms = [_transform([{"source"}], [{"branch", f"b{i}"}]) for i in range(width)]
+    join = Transform()
+    src = join.AddRequirement(properties={"source"})
+    for i in range(width):
+        join.AddRequirement(properties={"branch", f"b{i}"}, parents={src})
+    join.AddProduct(properties={"joined"})
+    transforms.append(join)
+    target = _transform([{"joined"}], [])
+    return Workload("diamond", [Endpoint({"source"})], target, transforms, dict(width=width))
+
+def FanIn(producers: int=8, stages: int=3):
+    """many interchangeable producers per stage, as with aligners and annotators"""
+    transforms = []
+    for s in range(stages):
+        for i in range(producers):
+            transforms.append(_transform([{f"s{s}"}], [{f"s{s+1}"}]))
+    summary = Transform()
+    for s in range(1, stages+1):
+        summary.AddRequirement(properties={f"s{s}"})
+    summary.AddProduct(properties={"summary"})
+    transforms.append(summary)
+    target = _transform([{"summary"}], [])
+    return Workload("fan_in", [Endpoint({"s0"})], target, transforms, dict(producers=producers, stages=stages))
+
+def LineageBins(assemblies: int=8, requested: int=2):
+    """annotations of bins that must derive from specific assemblies"""
+    transforms = [
+        _transform([{"assembly"}], [{"bins"}]),
+        _transform([{"bins"}], [{"orfs"}]),
+        _transform([{"orfs"}], [{"annotation"}]),
+        _transform([{"bins"}], [{"taxonomy"}]),
+    ]
+    given = [Endpoint({"assembly", f"sample={i}"}) for i in range(assemblies)]
+    target = Transform()
+    for e in given[:requested]:
+        asm = target.AddRequirement(properties=e.properties)
+        target.AddRequirement(properties={"annotation"}, parents={asm})
+        target.AddRequirement(properties={"taxonomy"}, parents={asm})
+    return Workload("lineage_bins", given, target, transforms, dict(assemblies=assemblies, requested=requested))
+
+def Decoys(decoys: int=64, length: int=4):
+    """a short chain hidden among producers whose inputs can never be made"""
+    w = Chain(length)
+    for i in range(decoys):
+        w.transforms.append(_transform([{f"missing{i}"}], [{f"a{1+i%length}"}]))
+    w.name = "decoys"
+    w.params = dict(decoys=decoys, length=length)
+    return w
+
+def Branches(branches: int=4, producers: int=2, stages: int=2):
+    """independent fan in pipelines requested together, as with a report over several analyses"""
+    transforms = []
+    target = Transform()
+    for b in range(branches):
+        branch = FanIn(producers, stages)
+        for tr in branch.transforms:
+            transforms.append(_transform(
+                [{f"b{b}-{p}" for p in req.properties} for req in tr.requires],
+                [{f"b{b}-{p}" for p in out.properties} for out in tr.produces],
+            ))
+        target.AddRequirement(properties={f"b{b}-summary"})
+    given = [Endpoint({f"b{b}-s0"}) for b in range(branches)]
+    return Workload("branches", given, target, transforms, dict(branches=branches, producers=producers, stages=stages))
+
+GENERATORS: dict[str, Callable[..., Workload]] = {
+    "chain": Chain,
+    "diamond": Diamond,
+    "fan_in": FanIn,
+    "lineage_bins": LineageBins,
+    "decoys": Decoys,
+    "branches": Branches,
+}
+
+def DefaultSuite():
+    return [
+        Chain(8), Chain(16),
+        Diamond(4), Diamond(8),
+        FanIn(4, 3), FanIn(8, 2),
+        LineageBins(8, 2), LineageBins(32, 4),
+        Decoys(64, 4), Decoys(512, 8),
+        Branches(4, 2, 2),
+    ]
+
+def Run(workload: Workload, mode: PlanningMode=PlanningMode.DFS, repeats: int=3, **solver_params):
+    solve = _solve_best_first if mode == PlanningMode.BEST_FIRST else _solve_by_bounded_dfs
+    # solutions are not kept between runs, so that later runs do not reuse their interned nodes
+    def _once():
+        stats = SolverStats()
+        producers = ProducerIndex(workload.transforms)
+        t0 = time.perf_counter()
+        solutions = solve(workload.given, workload.target, workload.transforms, producers=producers, stats=stats, **solver_params)
+        dt = time.perf_counter()-t0
+        return dt, len(solutions), len(solutions[0]) if len(solutions) > 0 else None, stats
+
+    times = []
+    for _ in range(max(1, repeats)):
+        dt, n_solutions, plan_length, stats = _once()
+        times.append(dt)
+
+    # separate run, since tracing allocations slows down the solver
+    tracemalloc.start()
+    try:
+        _once()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(
+        workload=workload.name,
+        params=workload.params,
+        mode=mode.value,
+        solver_params=solver_params,
+        wall_time=min(times),
+        wall_times=times,
+        peak_memory=peak,
+        solutions=n_solutions,
+        plan_length=plan_length,
+        stats=stats.Pack(),
+    )
+
+# the best first plan must be as cheap as the cheapest of the DFS, under each weighted objective, with
+# transforms of distinct weights, so that interchangeable producers differ in cost.
+# The makespan is the objective most prone to ties, see _BestFirst._priority
+def Optimality(workload: Workload|None=None):
+    workload = FanIn(3, 2) if workload is None else workload
+    weights = {tr:i+1 for i, tr in enumerate(workload.transforms)}
+    report = {}
+    for objective in [PlanObjective.COST, PlanObjective.MAKESPAN]:
+        cost = PlanCost(weights, objective)
+        best_first = _solve_best_first(workload.given, workload.target, workload.transforms, cost=cost)
+        dfs = _solve_by_bounded_dfs(workload.given, workload.target, workload.transforms, cost=cost)
+        assert len(best_first) == 1 and len(dfs) > 0, f"no plan for [{workload.name}] under [{objective.value}]"
+        found, best = cost.Plan(best_first[0].Steps()), min(cost.Plan(r.Steps()) for r in dfs)
+        assert found == best, f"best first plan costs [{found}] but the DFS found [{best}] under [{objective.value}]"
+        report[objective.value] = found
+    return dict(workload=workload.name, params=workload.params, costs=report)
+
+# builds a tree of distinct endpoints with lineage and hashes them, as a search
+# does for the endpoints it produces, to measure the cost per node of the model classes
+def Allocation(count: int=1_000_000, fanout: int=4):
+    proto = Endpoint({"step"})
+    def _build():
+        nodes = [Endpoint({"step", "root"})]
+        for i in range(1, count):
+            e = Endpoint({"step", f"branch={i%fanout}"}, parents={nodes[(i-1)//fanout]: proto})
+            e.hash
+            nodes.append(e)
+        return len(nodes)
+
+    t0 = time.perf_counter()
+    _build()
+    dt = time.perf_counter()-t0
+
+    tracemalloc.start()
+    try:
+        _build()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return dict(
+        nodes=count,
+        wall_time=dt,
+        peak_memory=peak,
+        bytes_per_node=peak/count,
+    )
@@ -12,7 +12,7 @@ import pty
 import time
 import random
 
-from ..hashing import KeyGenerator
+from ..hashing import UIDPool
 from ..serialization import StdTime
 
 def CurrentTimeMillis():
@@ -43,9 +43,9 @@ def RemoveLeadingIndent(s: str):
     if lines[-1][indent:] == "": cleaned += "\n"
     return cleaned
 
-_kg = KeyGenerator()
+_uids = UIDPool()
 def GenerateId():
-    return _kg.GenerateUID(12)
+    return _uids.Take(12)
 
 class ConnectionError(Exception):
     pass
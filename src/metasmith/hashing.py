@@ -1,9 +1,32 @@
+import os
+import mmap
 import numpy as np
-from hashlib import sha256
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import sha256, blake2b
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Iterable
+import weakref
 
 _ASCII_VOCAB_62 = [(48, 57), (65, 90), (97, 122)]
 _ASCII_VOCAB_62 = [i for a, b in _ASCII_VOCAB_62 for i in list(range(a, b+1))]
 _ASCII_VOCAB_62 = [chr(i) for i in _ASCII_VOCAB_62] # +["+", "!"]
+_BASE = len(_ASCII_VOCAB_62)
+# every pair of digits, most significant first, to convert 2 digits per division
+_DIGIT_PAIRS = [a+b for a in _ASCII_VOCAB_62 for b in _ASCII_VOCAB_62]
+
+# digests as integers, by name
+DIGESTS: dict[str, Callable[[bytes], int]] = dict(
+    sha256=lambda raw: int.from_bytes(sha256(raw).digest(), "big"),
+    blake2b=lambda raw: int.from_bytes(blake2b(raw, digest_size=16).digest(), "big"),
+)
+# for the keys of nodes, transforms and sources. These end up in persisted names, like those of
+# plans and their run directories, and of nextflow processes and channels, so they are sha256,
+# as in older versions, unless METASMITH_FAST_HASHING is set, which changes all of those names
+FAST_HASHING = os.environ.get("METASMITH_FAST_HASHING", "") not in {"", "0"}
+FAST_DIGEST = "blake2b" if FAST_HASHING else "sha256"
+
 class KeyGenerator:
     vocab = _ASCII_VOCAB_62
     def __init__(self, seed=None) -> None:
@@ -15,25 +38,112 @@ class KeyGenerator:
             digits = self._generator.integers(0, len(self.vocab), l)
             key = "".join([self.vocab[i] for i in digits])
         return key
-    
+
+    # the l least significant base 62 digits
     @classmethod
     def FromInt(cls, i: int, l: int=8, little_endian=False):
-        chunks = [cls.vocab[0]]*l
-        place = 0
-        while i > 0 and place < l:
-            chunk_k = i % len(cls.vocab)
-            i = (i - chunk_k) // len(cls.vocab)
-            chunks[place] = cls.vocab[chunk_k]
-            place += 1
-        if not little_endian: chunks.reverse()
-        return "".join(chunks)
-    
+        i = i % (_BASE**l) if i > 0 else 0
+        key = ""
+        for _ in range(l//2):
+            i, pair = divmod(i, _BASE*_BASE)
+            key = _DIGIT_PAIRS[pair]+key
+        if l % 2 == 1: key = cls.vocab[i]+key
+        return key[::-1] if little_endian else key
+
     @classmethod
     def FromHex(cls, hex: str, l: int=8, little_endian=False):
         i = int(hex, 16)
         return i, cls.FromInt(i, l, little_endian)
 
     @classmethod
-    def FromStr(cls, s: str, l: int=8, little_endian=False):
-        _hex = sha256(s.encode("utf-8", "replace")).hexdigest()
-        return cls.FromHex(_hex, l, little_endian)
+    def FromStr(cls, s: str, l: int=8, little_endian=False, digest: str="sha256"):
+        """
+        @digest: a name in DIGESTS
+        """
+        if len(s) > _MAX_MEMOIZED: return _from_str(s, l, little_endian, digest)
+        return _from_str_memoized(s, l, little_endian, digest)
+
+    # see FAST_DIGEST
+    @classmethod
+    def FromStrFast(cls, s: str, l: int=8):
+        return cls.FromStr(s, l, digest=FAST_DIGEST)
+
+def _from_str(s: str, l: int, little_endian: bool, digest: str):
+    i = DIGESTS[digest](s.encode("utf-8", "replace"))
+    return i, KeyGenerator.FromInt(i, l, little_endian)
+
+# the same signatures are hashed repeatedly, but long strings, like the
+# dumps of whole libraries, are not kept
+_MAX_MEMOIZED = 1024
+_from_str_memoized = lru_cache(maxsize=2**16)(_from_str)
+
+# bytes from 248 are dropped, so that the rest map evenly onto the 62 characters
+_UID_REJECTED = bytes(range(_BASE*(256//_BASE), 256))
+_UID_TABLE = bytes(ord(_ASCII_VOCAB_62[b % _BASE]) for b in range(256))
+
+# random keys cut from batches of os.urandom, for ids that are drawn often,
+# like those of messages, without a call into numpy for each
+class UIDPool:
+    def __init__(self, batch: int=4096) -> None:
+        """
+        @batch: bytes drawn at a time
+        """
+        assert batch > 0, f"batch must be positive but got [{batch}]"
+        self.batch = batch
+        self._lock = Lock()
+        self._reset()
+        _UID_POOLS.add(self)
+
+    def _reset(self):
+        self._chars = ""
+        self._pos = 0
+
+    def Take(self, l: int=12) -> str:
+        with self._lock:
+            while self._pos+l > len(self._chars):
+                fresh = os.urandom(self.batch).translate(_UID_TABLE, _UID_REJECTED).decode("ascii")
+                self._chars = self._chars[self._pos:]+fresh
+                self._pos = 0
+            key = self._chars[self._pos:self._pos+l]
+            self._pos += l
+        return key
+
+# a forked child must not hand out the same ids as its parent
+_UID_POOLS: weakref.WeakSet[UIDPool] = weakref.WeakSet()
+def _reset_uid_pools():
+    for pool in _UID_POOLS:
+        pool._lock = Lock()
+        pool._reset()
+os.register_at_fork(after_in_child=_reset_uid_pools)
+
+# files from this size are mapped into memory and hashed in one call, which
+# releases the GIL, smaller ones are read in chunks
+_MMAP_THRESHOLD = 2**26
+_CHUNK = 2**20
+
+# sha256 of the contents of a file, or of a directory as the relative
+# paths and digests of the files within, in order
+def DigestFile(path: Path|str) -> str:
+    path = Path(path)
+    h = sha256()
+    if path.is_dir():
+        for p in sorted(x for x in path.rglob("*") if x.is_file()):
+            h.update(f"{p.relative_to(path).as_posix()}:{DigestFile(p)}\n".encode("utf-8", "replace"))
+        return h.hexdigest()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= _MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        else:
+            while chunk := f.read(_CHUNK):
+                h.update(chunk)
+    return h.hexdigest()
+
+def DigestFiles(paths: Iterable[Path|str], workers: int|None=None) -> list[str]:
+    """
+    @workers: threads to hash with, the executor's default if None
+    """
+    paths = list(paths)
+    if len(paths) <= 1 or workers == 1: return [DigestFile(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(DigestFile, paths))
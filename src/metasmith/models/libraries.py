@@ -1,5 +1,6 @@
 from __future__ import annotations
 import os, sys
+import pickle
 from pathlib import Path
 import yaml
 from dataclasses import dataclass, field
@@ -7,11 +8,12 @@ from typing import Callable, Iterable
 from importlib import metadata, reload, __import__
 
 from ..coms.ipc import LiveShell
-from .solver import Dependency, Endpoint, Transform
+from .solver import Dependency, Endpoint, Transform, PlanObjective
 from .remote import GlobusSource, Logistics, Source, SourceType
-from ..hashing import KeyGenerator
+from ..hashing import KeyGenerator, DigestFiles
 from ..logging import Log
-from ..constants import VERSION
+from ..serialization import YamlLoader
+from ..constants import NAME, VERSION
 
 @dataclass
 class DataTypeOntology:
@@ -82,15 +84,53 @@ class DataTypeLibrary:
             params["ontology"] = DataTypeOntology.Unpack(d["ontology"])
         return cls(**params)
 
+    @classmethod
+    def _parse(cls, path: Path):
+        with open(path) as f:
+            d = yaml.load(f, Loader=YamlLoader)
+        return cls.Unpack(d)
+
+    # parsed libraries are pickled in the user's cache, keyed by the yaml's resolved path, size and
+    # modification time, since the same library is loaded again for every transform that resolves it.
+    # Not in the library, since libraries are shared and a pickle can run code when loaded
+    @classmethod
+    def _cache_path(cls, path: Path) -> Path|None:
+        root = os.environ.get("XDG_CACHE_HOME", "")
+        try:
+            root = Path(root) if root != "" else Path.home()/".cache"
+        except RuntimeError: # no home directory, so nothing is cached
+            return None
+        _, k = KeyGenerator.FromStr(str(path), l=16)
+        return root/NAME/"types"/(k+".pkl")
+
     @classmethod
     def Load(cls, path: Source|str|Path) -> DataTypeLibrary:
         if isinstance(path, Source):
             path = path.address
         # todo, urls
-        _path = Path(path)
-        with open(_path) as f:
-            d = yaml.safe_load(f)
-        return cls.Unpack(d)
+        _path = Path(path).resolve()
+        st = _path.stat()
+        stamp = (VERSION, str(_path), st.st_size, st.st_mtime_ns)
+        cache_path = cls._cache_path(_path)
+        if cache_path is None: return cls._parse(_path)
+        if cache_path.exists():
+            try:
+                with open(cache_path, "rb") as f:
+                    cached_stamp, lib = pickle.load(f)
+                if cached_stamp == stamp: return lib
+            except Exception: # unreadable, or from an incompatible version
+                pass
+
+        lib = cls._parse(_path)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump((stamp, lib), f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(cache_path)
+        except OSError: # no writable cache, so parse each time
+            pass
+        return lib
 
     def Pack(self):
         return dict(
@@ -109,14 +149,15 @@ class DataInstance:
     dtype: Endpoint
     dtype_name: str
     parent_lib: DataInstanceLibrary
+    checksum: str|None = None
 
+    # by content if a checksum is given, so that the same data in any library has the same key
     def __post_init__(self):
-        self._hash, self._key = KeyGenerator.FromStr("".join([
-            str(self.path),
-            self.dtype.key,
-            self.dtype_name,
-            self.parent_lib.GetKey(),
-        ]), l=8)
+        if self.checksum is None:
+            parts = [str(self.path), self.dtype.key, self.dtype_name, self.parent_lib.GetKey()]
+        else:
+            parts = [self.checksum, self.dtype.key, self.dtype_name]
+        self._hash, self._key = KeyGenerator.FromStr("".join(parts), l=8)
 
     def __hash__(self) -> int:
         return self._hash
@@ -125,10 +166,12 @@ class DataInstance:
         return self.parent_lib.location/self.path
 
     def Pack(self):
-        return dict(
+        d = dict(
             path=str(self.path),
             dtype=f"{self.parent_lib.GetKey()}::{self.dtype_name}",
         )
+        if self.checksum is not None: d["checksum"] = self.checksum
+        return d
     
     @classmethod
     def Unpack(cls, raw: dict, libraries: dict[str, DataTypeLibrary]):
@@ -140,6 +183,7 @@ class DataInstance:
             dtype=dtype,
             dtype_name=f"{namespace}::{dtype_name}",
             parent_lib=lib,
+            checksum=raw.get("checksum"),
         )
 
 class DataInstanceLibrary:
@@ -147,6 +191,7 @@ class DataInstanceLibrary:
     _path_to_meta: Path = Path("./_metadata")
     _path_to_types: Path = Path("./_metadata/types")
     _index_name: str = "index"
+    _checksums_name: str = "checksums"
     _metadata_ext: str = ".yml"
 
     def __init__(self, location: Path|str|DataInstanceLibrary) -> None:
@@ -268,6 +313,55 @@ class DataInstanceLibrary:
             self._calculate_key()
         return self._hash
 
+    # size, modification time and inode, which change if the data does
+    @classmethod
+    def _stamp(cls, path: Path):
+        st = path.stat()
+        if not path.is_dir(): return [st.st_size, st.st_mtime_ns, st.st_ino]
+        size, mtime = 0, st.st_mtime_ns
+        for p in path.rglob("*"):
+            pst = p.stat()
+            if p.is_file(): size += pst.st_size
+            mtime = max(mtime, pst.st_mtime_ns)
+        return [size, mtime, st.st_ino]
+
+    # sha256 of each item in the manifest. These are kept in the metadata, apart from the
+    # index so that the library's key is unchanged, and only recomputed for items whose stamp has changed
+    def Checksums(self, workers: int|None=None) -> dict[Path, str]:
+        """
+        @workers: threads to hash with
+        """
+        cache_path = self.location/self._path_to_meta/(self._checksums_name+self._metadata_ext)
+        cached: dict[str, dict] = {}
+        if cache_path.exists():
+            with open(cache_path) as f:
+                cached = yaml.load(f, Loader=YamlLoader) or {}
+        checksums: dict[Path, str] = {}
+        stale: list[tuple[Path, list]] = []
+        for k in self.manifest:
+            stamp = self._stamp(self.location/k)
+            entry = cached.get(str(k))
+            if entry is not None and entry.get("stamp") == stamp:
+                checksums[k] = entry["digest"]
+            else:
+                stale.append((k, stamp))
+        if len(stale) == 0: return checksums
+
+        digests = DigestFiles([self.location/k for k, _ in stale], workers=workers)
+        for (k, stamp), digest in zip(stale, digests):
+            checksums[k] = digest
+            cached[str(k)] = dict(stamp=stamp, digest=digest)
+        cached = {str(k):cached[str(k)] for k in self.manifest}
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                yaml.dump(cached, f)
+            tmp_path.replace(cache_path)
+        except OSError: # read only, so hash each time
+            pass
+        return checksums
+
     def Pack(self):
         return dict(
             schema=self.schema,
@@ -325,7 +419,7 @@ class DataInstanceLibrary:
             dtypes[k] = DataTypeLibrary.Load(p)
 
         with open(index_path) as f:
-            d = yaml.safe_load(f)
+            d = yaml.load(f, Loader=YamlLoader)
             self = cls.Unpack(location=path, raw=d, dtypes=dtypes)
         self.types = dtypes
         return self
@@ -356,6 +450,36 @@ class DataInstanceLibrary:
         assert len(res.completed) == 1, f"move failed"
         return cls.Load(dest)
 
+# optional estimates for a single run of a transform, used to rank plans
+@dataclass
+class TransformCost:
+    duration: float|None = None # seconds of wall time
+    cpu_hours: float|None = None
+    memory: float|None = None # peak, in GB
+    data_volume: float|None = None # read and written, in GB
+
+    def Weight(self, objective: PlanObjective) -> float|None:
+        match objective:
+            case PlanObjective.MAKESPAN:
+                return self.duration
+            case PlanObjective.COST:
+                # a single core, if only the duration is known
+                if self.cpu_hours is not None: return self.cpu_hours
+                return self.duration/3600 if self.duration is not None else None
+            case _:
+                return 1.0
+
+    def Pack(self):
+        d = {}
+        for k, v in self.__dict__.items():
+            if k.startswith("_") or v is None: continue
+            d[k] = v
+        return d
+
+    @classmethod
+    def Unpack(cls, d: dict):
+        return cls(**d)
+
 # this should function like a view provided by the parent library
 @dataclass
 class TransformInstance:
@@ -363,12 +487,16 @@ class TransformInstance:
     model: Transform
     output_signature: dict[Dependency, Path]
     name: str = None
+    cost: TransformCost|dict|None = None
 
     def __post_init__(self):
+        if isinstance(self.cost, dict):
+            self.cost = TransformCost.Unpack(self.cost)
         for k, vt in [
             ("protocol", Callable),
             ("model", Transform),
             ("output_signature", dict),
+            ("cost", TransformCost|None),
         ]:
             v = getattr(self, k)
             assert isinstance(v, vt), f"[{k}] must be of type [{vt}] but got [{type(v)}]"
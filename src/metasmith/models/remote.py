@@ -162,7 +162,7 @@ class Source:
     def __post_init__(self):
         if not isinstance(self.address, str):
             self.address = str(self.address)
-        h, k = KeyGenerator.FromStr(f"{self.address}{self.type}")
+        h, k = KeyGenerator.FromStrFast(f"{self.address}{self.type}")
         self._hash = h
 
     def __hash__(self) -> int:
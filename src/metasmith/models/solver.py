@@ -1,10 +1,21 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from enum import Enum
 from typing import Any, Callable, Generator, Iterable
+from collections import OrderedDict
+from collections.abc import KeysView
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import heapq
 import json
+import math
+import numpy as np
+import sys
+import time
+import weakref
 
-from ..hashing import KeyGenerator
+from ..hashing import FAST_HASHING, KeyGenerator
+from ..logging import Log
     
 class Namespace:
     def __init__(self, key_length=5, seed: int|None=None, key_from_order=False) -> None:
@@ -51,7 +62,39 @@ def _set_default_namespace(namespace: Namespace):
 #         K = "key"
 #         return hasattr(__value, K) and self.key == getattr(__value, K)
 
+# maps each property string to its own bit so that property sets can be
+# compared as integer bitmasks
+class PropertyInterner:
+    def __init__(self) -> None:
+        self._bits: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._bits)
+
+    def Bit(self, prop: str) -> int:
+        bit = self._bits.get(prop)
+        if bit is None:
+            bit = 1 << len(self._bits)
+            self._bits[prop] = bit
+        return bit
+
+    def Mask(self, properties: Iterable[str]) -> int:
+        mask = 0
+        for prop in properties:
+            mask |= self.Bit(prop)
+        return mask
+
+    # masks as rows of 64 bit words, to compare many at once
+    def Words(self, masks: list[int]) -> np.ndarray:
+        n_words = max(1, (len(self._bits)+63)//64)
+        raw = b"".join(m.to_bytes(n_words*8, "little") for m in masks)
+        return np.frombuffer(raw, dtype="<u8").reshape(len(masks), n_words)
+
+_PROPERTY_INTERNER = PropertyInterner()
+
 class Node:
+    __slots__ = ("properties", "mask", "parents", "_sig", "_hash", "_key", "__weakref__")
+
     def __init__(
         self,
         properties: set[str],
@@ -60,14 +103,40 @@ class Node:
     ) -> None:
         super().__init__()
         assert isinstance(properties, set)
-        assert isinstance(parents, set)
+        assert isinstance(parents, set|KeysView)
         self.properties = properties
+        self.mask = _PROPERTY_INTERNER.Mask(properties)
         self.parents = parents
         self._sig = _sig
-        self.hash, self.key = KeyGenerator.FromStr(self.Signature())
+        self.Signature() # identity is fixed at creation, but only hashed when first needed
+        self._hash: int|None = None
+        self._key: str|None = None
         # self._diffs = set()
         # self._sames = set()
 
+    @property
+    def hash(self) -> int:
+        if self._hash is None: self._update_hash()
+        return self._hash
+
+    @hash.setter
+    def hash(self, value: int):
+        self._hash = value
+
+    @property
+    def key(self) -> str:
+        if self._key is None: self._update_hash()
+        return self._key
+
+    @key.setter
+    def key(self, value: str):
+        self._key = value
+
+    def _update_hash(self):
+        h, k = KeyGenerator.FromStrFast(self.Signature())
+        if self._hash is None: self._hash = h
+        if self._key is None: self._key = k
+
     def __hash__(self) -> int:
         return self.hash
     
@@ -80,19 +149,20 @@ class Node:
     def __repr__(self) -> str:
         return f"{self}"
     
+    # masks are local to the process, so are made again from the properties when unpickled
+    def __reduce__(self):
+        return _rebuild_node, (self.__class__, self.properties, self.parents, self._sig, self._hash, self._key)
+
     def IsA(self, other: Node) -> bool:
-        # if other.key in self._diffs: return False
-        # if other.key in self._sames: return True
-        if not other.properties.issubset(self.properties):
-            # self._diffs.add(other.key)
-            return False
-        # self._sames.add(other.key)
+        # properties are a subset iff all of other's bits are set in ours
         # if compare_lineage: return  other.parents.issubset(self.parents)
-        return True
+        return self.mask & other.mask == other.mask
 
     def Signature(self):
         if self._sig is None:
-            psig = ",".join(sorted(p.Signature() for p in self.parents))
+            # embedding the signatures of parents grows exponentially with depth, so they are
+            # given by key with FAST_HASHING, which changes the keys of nodes with lineage
+            psig = ",".join(sorted(p.key if FAST_HASHING else p.Signature() for p in self.parents))
             sig = ",".join(sorted(self.properties))
             self._sig = f'{sig}:[{psig}]' if len(self.parents)>0 else sig
         return self._sig
@@ -104,10 +174,12 @@ class Node:
     def AddProperty(self, value: str, key: str=None):
         if key is None:
             assert not self._props_have_keys(), "this endpoint's properties have keys"
-            self.properties.add(self._json_dumps([value]))
+            prop = self._json_dumps([value])
         else:
             assert self._props_have_keys(), "this endpoint's properties do not have keys"
-            self.properties.add(self._json_dumps({key:value}))
+            prop = self._json_dumps({key:value})
+        self.properties.add(prop)
+        self.mask |= _PROPERTY_INTERNER.Bit(prop)
         return self
     
     def Clone(self, properties_only: bool=False):
@@ -196,6 +268,8 @@ class Node:
 
 # of a Transform
 class Dependency(Node):
+    __slots__ = ()
+
     def __init__(self, properties: set[str], parents: set[Node]) -> None:
         super().__init__(properties=properties, parents=parents)
 
@@ -204,30 +278,107 @@ class Dependency(Node):
 
 # as in a free floating data type
 class Endpoint(Node):
+    __slots__ = ("_parent_map", "_ancestors")
+
     def __init__(self, properties: set[str], parents: dict[Endpoint, Node]=dict()) -> None:
         if isinstance(parents, set):
             parents = {p:p for p in parents}
-        super().__init__(properties=properties, parents=set(parents.keys()))
+        # a view of the map, rather than a copy of its keys
+        super().__init__(properties=properties, parents=parents.keys())
         self._parent_map = parents # real, proto
+        self._ancestors: dict[int, tuple[Endpoint|None, tuple[Endpoint, ...]]]|None = None
+
+    def __reduce__(self):
+        state = None
+        if not isinstance(self.parents, KeysView): # replaced, as by Unpack
+            state = None, dict(parents=self.parents)
+        return _rebuild_node, (self.__class__, self.properties, self._parent_map, self._sig, self._hash, self._key), state
 
     def Iterparents(self):
         """real, prototype"""
         for e, p in self._parent_map.items():
             yield e, p
 
+    # lineage lookups by prototype mask, since IsA depends only on the mask.
+    # Each mask is resolved with one scan of the parents, then memoized
+    def _ancestry(self, proto: Node):
+        if self._ancestors is None: self._ancestors = {}
+        entry = self._ancestors.get(proto.mask)
+        if entry is None:
+            nearest = None
+            bound: list[Endpoint] = []
+            # later parents are closer, so the first match in reverse is the nearest
+            for p, pproto in reversed(self._parent_map.items()):
+                if nearest is None and p.IsA(proto): nearest = p
+                if proto.IsA(pproto) and p not in bound: bound.append(p)
+            entry = nearest, tuple(bound)
+            self._ancestors[proto.mask] = entry
+        return entry
+
+    def NearestAncestor(self, proto: Node) -> Endpoint|None:
+        """
+        @param proto: the prototype an ancestor must be
+        """
+        return self._ancestry(proto)[0]
+
+    def BoundAs(self, proto: Node) -> tuple[Endpoint, ...]:
+        """
+        @param proto: ancestors whose prototypes this satisfies are returned
+        """
+        return self._ancestry(proto)[1]
+
+def _rebuild_node(cls: type[Node], properties: set[str], parents: set[Node]|dict[Endpoint, Node], sig: str|None, hash: int|None, key: str|None):
+    node = cls(properties=properties, parents=parents)
+    node._sig, node._hash, node._key = sig, hash, key
+    return node
+
+# canonical instances of structurally identical nodes, so that endpoints made by
+# applying transforms share their lineage graphs and each signature is hashed once.
+# Nodes are mutable, so only intern those that are not modified after creation.
+class NodeInterner:
+    def __init__(self) -> None:
+        self._table: weakref.WeakValueDictionary[tuple, Node] = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def _get(self, k: tuple, make: Callable[[], Node]):
+        node = self._table.get(k)
+        if node is None:
+            self.misses += 1
+            node = make()
+            self._table[k] = node
+        else:
+            self.hits += 1
+        return node
+
+    # parents are identified by hash, and also by prototype for endpoints, since
+    # nodes are equal regardless of the prototypes of their parents.
+    # A different order of the same parents only costs a duplicate.
+    def Endpoint(self, properties: set[str], parents: dict[Endpoint, Node]) -> Endpoint:
+        k = (Endpoint, _PROPERTY_INTERNER.Mask(properties), tuple(h for e, p in parents.items() for h in (e.hash, p.hash)))
+        return self._get(k, lambda: Endpoint(properties=properties, parents=parents))
+
+_NODE_INTERNER = NodeInterner()
+
 class Transform:
+    __slots__ = ("requires", "produces", "_input_group_map", "_seen", "_labels", "_hash", "_key")
+
     def __init__(self) -> None:
         super().__init__()
         self.requires: list[Dependency] = list()
         self.produces: list[Dependency] = list()
         self._input_group_map: dict[int, list[Dependency]] = {}
         self._seen: set[str] = set()
+        # str of each requirement and product, as they are added
+        self._labels: tuple[list[str], list[str]] = ([], [])
         self._update_hash()
 
     def __str__(self) -> str:
-        def _props(d: Dependency):
-            return "{"+"-".join(sorted(d.properties))+"}"
-        return f"{','.join(_props(r) for r in self.requires)}->{','.join(_props(p) for p in self.produces)}"
+        requires, produces = self._labels
+        return f"{','.join(requires)}->{','.join(produces)}"
 
     def __repr__(self) -> str:
         return str(self)
@@ -235,8 +386,19 @@ class Transform:
     def __hash__(self) -> int:
         return self.hash
 
+    @property
+    def hash(self) -> int:
+        if self._hash is None: self._hash, self._key = KeyGenerator.FromStrFast(str(self))
+        return self._hash
+
+    @property
+    def key(self) -> str:
+        if self._key is None: self._hash, self._key = KeyGenerator.FromStrFast(str(self))
+        return self._key
+
+    # the hash is of str(self), which only changes as dependencies are added
     def _update_hash(self):
-        self.hash, self.key = KeyGenerator.FromStr(str(self))
+        self._hash, self._key = None, None
 
     def AddRequirement(self, node: Node=None, properties: Iterable[str]=None, parents: set[Dependency]=None):
         return self._add_dependency(destination=self.requires, node=node, properties=properties, parents=parents)
@@ -251,6 +413,7 @@ class Transform:
         _dep = Dependency(properties=_properties, parents=parents)
         _parents = _dep.parents
         destination.append(_dep)
+        self._labels[0 if destination is self.requires else 1].append("{"+"-".join(sorted(_dep.properties))+"}")
         if destination == self.requires:
             i = len(self.requires)-1
             for p in _parents:
@@ -259,19 +422,57 @@ class Transform:
         self._update_hash()
         return _dep
     
-    # just all possibilities regardless of lineage
-    def Possibilities(self, have: set[Endpoint], constraints: dict[Dependency, Endpoint]=dict()) -> Generator[list[Endpoint], Any, None]:
-        matches: list[list[Endpoint]] = []
+    # rows for nodes and columns for endpoints, true where the endpoint is the node
+    @classmethod
+    def _isa_matrix(cls, nodes: list[Node], have: list[Endpoint]) -> np.ndarray:
+        rows = _PROPERTY_INTERNER.Words([n.mask for n in nodes])[:, None, :]
+        cols = _PROPERTY_INTERNER.Words([e.mask for e in have])[None, :, :]
+        return ((cols & rows) == rows).all(axis=2)
+
+    # requirements in rows and endpoints in columns, true where the endpoint can be the input
+    def Compatibility(self, have: list[Endpoint]) -> np.ndarray:
+        return self._isa_matrix(self.requires, have)
+
+    # true at [a, b] where have[a] is an ancestor of have[b]
+    @classmethod
+    def Lineage(cls, have: list[Endpoint]) -> np.ndarray:
+        index = {e:i for i, e in enumerate(have)}
+        adjacency = np.zeros((len(have), len(have)), dtype=bool)
+        for b, e in enumerate(have):
+            for p in e.parents:
+                a = index.get(p)
+                if a is not None: adjacency[a, b] = True
+        return adjacency
+
+    # the endpoints to choose from and their compatibility, with constrained requirements
+    # limited to their endpoint. None if a requirement has no candidates or no constraint applies.
+    def _compatible(self, have: Iterable[Endpoint], constraints: dict[Dependency, Endpoint]):
+        have = list(have)
+        seen = set(have)
+        for e in constraints.values():
+            if e in seen: continue
+            have.append(e); seen.add(e)
+        index = {e:i for i, e in enumerate(have)}
+        compatible = self.Compatibility(have)
         constraints_used = False
-        for req in self.requires:
-            if req in constraints:
-                must_use = constraints[req]
-                _m = [must_use]
-            else:
-                _m = [m for m in have if m.IsA(req)]
-            if len(_m) == 0: return None
-            matches.append(_m)
+        for i, req in enumerate(self.requires):
+            if req not in constraints: continue
+            compatible[i] = False
+            compatible[i, index[constraints[req]]] = True
+            constraints_used = True
         if len(constraints)>0 and not constraints_used: return None
+        if not compatible.any(axis=1).all(): return None
+        return have, compatible
+
+    # just all possibilities regardless of lineage
+    def Possibilities(self, have: set[Endpoint], constraints: dict[Dependency, Endpoint]=dict()) -> Generator[list[Endpoint], Any, None]:
+        compatible = self._compatible(have, constraints)
+        if compatible is None: return None
+        have, compatible = compatible
+        matches: list[list[Endpoint]] = [[have[j] for j in np.flatnonzero(row)] for row in compatible]
+        if len(matches) == 0:
+            yield []
+            return
 
         indexes = [0]*len(matches)
         indexes[0] = -1
@@ -286,35 +487,59 @@ class Transform:
         while _advance():
             yield [matches[i][j] for i, j in enumerate(indexes)]
     
-    # filter possibilities based on correct lineage
+    # filter possibilities based on correct lineage: for each prototype parent of a
+    # requirement, an input chosen before it must be the prototype and its ancestor
     def Valids(self, matches: Iterable[list[Endpoint]]):
-        black_list: set[tuple[int, Endpoint]] = set()
-        white_list: set[tuple[int, Endpoint]] = set()
-
-        choosen: list[Endpoint] = []
         for config in matches:
             ok = True
-            for i, (e, r) in enumerate(zip(config, self.requires)):
-                k = (i, e)
-                if k in black_list: ok=False; break
-                if k in white_list: continue
-                
-                parents = self._input_group_map.get(i, [])
-                if len(parents) == 0: # no lineage req.
-                    white_list.add(k)
-                    continue
-                
-                for prototype in parents:
-                    # parent must already be in choosen, since it must have been added
-                    # as a req. before being used as a parent during setup
-                    found = False
-                    for p in choosen:
-                        if not p.IsA(prototype): continue
-                        if p in e.parents: found=True; break
-                    if not found: black_list.add(k); ok=False; break
+            for i, e in enumerate(config):
+                for prototype in self._input_group_map.get(i, []):
+                    if not any(p.IsA(prototype) and p in e.parents for p in config[:i]):
+                        ok = False; break
                 if not ok: break
             if ok: yield config
 
+    # what Valids would keep of Possibilities, without enumerating the rest, as candidates
+    # for each requirement are narrowed by the lineage of the inputs chosen before it.
+    # Yields in a different order, the last requirement varying fastest.
+    def ValidPossibilities(self, have: set[Endpoint], constraints: dict[Dependency, Endpoint]=dict()) -> Generator[list[Endpoint], Any, None]:
+        compatible = self._compatible(have, constraints)
+        if compatible is None: return None
+        have, compatible = compatible
+        n = len(self.requires)
+        if n == 0:
+            yield []
+            return
+        ancestry = self.Lineage(have)
+        # for each requirement, which endpoints are each of its prototype parents
+        prototypes = [self._isa_matrix(self._input_group_map.get(i, []), have) for i in range(n)]
+
+        chosen: list[int] = []
+        def _candidates(i: int):
+            allowed = compatible[i]
+            if len(prototypes[i]) > 0:
+                before = np.array(chosen, dtype=int)
+                for isa in prototypes[i]:
+                    allowed = allowed & ancestry[before[isa[before]]].any(axis=0)
+            return np.flatnonzero(allowed)
+
+        options = [_candidates(0)]
+        cursor = [0]
+        while len(options) > 0:
+            i = len(options)-1
+            if cursor[i] >= len(options[i]):
+                options.pop(); cursor.pop()
+                if len(chosen) > 0: chosen.pop()
+                continue
+            chosen.append(int(options[i][cursor[i]]))
+            cursor[i] += 1
+            if i == n-1:
+                yield [have[j] for j in chosen]
+                chosen.pop()
+                continue
+            options.append(_candidates(i+1))
+            cursor.append(0)
+
     def Apply(self, inputs: Iterable[tuple[Endpoint, Node]]):
         # deleted = {}
         # for r, (e, e_proto) in zip(self.requires, inputs):
@@ -330,7 +555,7 @@ class Transform:
         for e, eproto in inputs_dict.items():
             parent_dict[e] = eproto
         produced = {
-            Endpoint(
+            _NODE_INTERNER.Endpoint(
                 properties=out.properties,
                 parents=parent_dict
             ):out
@@ -339,7 +564,7 @@ class Transform:
         return Application(self, inputs_dict, produced)
 
 # an application of a transform on a set of inputs to produce outputs
-@dataclass
+@dataclass(slots=True)
 class Application:
     transform: Transform
     used: dict[Endpoint, Node]
@@ -353,15 +578,29 @@ class Application:
     def __repr__(self) -> str:
         return f"{self}"
 
-@dataclass
+@dataclass(slots=True)
 class Result:
     application: Application
     dependency_plan: list[Application]
 
     def __len__(self):
         return len(self.dependency_plan)
+
+    def Steps(self):
+        return self.dependency_plan
+
+    # (i, j) where step j of the dependency plan uses a product of step i
+    def Edges(self) -> list[tuple[int, int]]:
+        producer_of: dict[Endpoint, int] = {}
+        edges = []
+        for j, appl in enumerate(self.dependency_plan):
+            for i in sorted({producer_of[e] for e in appl.used if e in producer_of}):
+                edges.append((i, j))
+            for e in appl.produced:
+                producer_of[e] = j
+        return edges
     
-@dataclass
+@dataclass(slots=True)
 class DependencyResult:
     plan: list[Application]
     endpoint: Endpoint
@@ -369,49 +608,549 @@ class DependencyResult:
     def __len__(self):
         return len(self.plan)
 
-# lineage is satisfied at depth 1 (parents of parents are not considered) 
-def _solve_by_bounded_dfs(given: Iterable[Endpoint], target: Transform, transforms: Iterable[Transform], horizon: int=64, _debug=False):
-    @dataclass
-    class State:
-        have: dict[Endpoint, Dependency]
-        needed: set[Dependency]
-        target: Dependency|Transform
-        lineage_requirements: dict[Node, Endpoint]
-        seen_signatures: set[str]
-        depth: int
-
-    def _get_producers_of(target: Dependency):
-        for tr in transforms:
+    def Steps(self):
+        return self.plan
+
+# inverted index of product properties to the transforms that produce them
+class ProducerIndex:
+    def __init__(self, transforms: Iterable[Transform]) -> None:
+        self.transforms: list[Transform] = list(transforms)
+        self._ids = {id(tr) for tr in self.transforms}
+        self._pruned: OrderedDict[frozenset[int], ProducerIndex] = OrderedDict() # see Pruned
+        self._postings: dict[str, set[int]] = {}
+        self._all: list[int] = [] # transforms with at least 1 product
+        self._lookups: dict[int, list[Transform]] = {}
+        for i, tr in enumerate(self.transforms):
+            if len(tr.produces) > 0: self._all.append(i)
             for p in tr.produces:
-                if p.IsA(target):
-                    yield tr
-                    break
-
-    if _debug:
-        log_path = Path("./cache/debug_log.txt")
-        log_path.parent.mkdir(parents=True, exist_ok=True)
-        log = open("./cache/debug_log.txt", "w")
-        debug_print = lambda *args: log.write(" ".join(str(a) for a in args)+"\n") if args[0] != "END" else log.close()
-    else:
-        debug_print = lambda *args: None
-
-    _apply_cache: dict[str, Application] = {}
-    def _apply(target: Transform, inputs: Iterable[tuple[Endpoint, Node]]):
-        sig  = "".join(e.key+d.key for e, d in inputs)
-        if sig in _apply_cache:
-            return _apply_cache[sig]
+                for prop in p.properties:
+                    self._postings.setdefault(prop, set()).add(i)
+
+    # by identity, as the planner tells transforms apart, since those loaded
+    # again from the same library have the same keys but are other objects
+    def IsFor(self, transforms: Iterable[Transform]) -> bool:
+        transforms = list(transforms)
+        return len(transforms) == len(self.transforms) and all(a is b for a, b in zip(transforms, self.transforms))
+
+    # an index of only the given subset of the transforms, such as those left by _prune,
+    # kept for the next call with the same subset, so that reusing this index is not
+    # undone by pruning. Only the most recent few subsets are kept.
+    def Pruned(self, keep: Iterable[Transform]) -> ProducerIndex:
+        k = frozenset(id(tr) for tr in keep)
+        if len(k) == len(self.transforms) and k == self._ids: return self
+        sub = self._pruned.get(k)
+        if sub is None:
+            sub = ProducerIndex(tr for tr in self.transforms if id(tr) in k)
+            if len(self._pruned) >= 8: self._pruned.popitem(last=False)
+        else:
+            self._pruned.move_to_end(k)
+        self._pruned[k] = sub
+        return sub
+
+    def Has(self, transform: Transform) -> bool:
+        return id(transform) in self._ids
+
+    def ProducersOf(self, target: Node) -> list[Transform]:
+        k = target.mask
+        if k in self._lookups: return self._lookups[k]
+        if k == 0:
+            candidates = self._all
+        else:
+            postings = []
+            for prop in target.properties:
+                if prop not in self._postings:
+                    postings = []; break
+                postings.append(self._postings[prop])
+            if len(postings) == 0:
+                candidates = []
+            else:
+                postings.sort(key=len)
+                hits = set(postings[0])
+                for other in postings[1:]:
+                    hits &= other
+                    if len(hits) == 0: break
+                candidates = sorted(hits) # keep library order
+        producers = []
+        for i in candidates:
+            tr = self.transforms[i]
+            # properties may be spread across several products of the same transform
+            if any(p.IsA(target) for p in tr.produces):
+                producers.append(tr)
+        self._lookups[k] = producers
+        return producers
+
+@dataclass(slots=True)
+class _SearchState:
+    have: dict[Endpoint, Dependency]
+    target: Dependency|Transform
+    lineage_requirements: dict[Node, Endpoint]
+    depth: int
+    have_sig: int = 0 # see _zobrist
+    lineage_sig: tuple[int, ...] = tuple() # hashes of the lineage requirements, in order
+
+    def MemoKey(self):
+        return self.have_sig, self.target.hash, self.lineage_sig
+
+# order independent signature of a set of endpoints that can be
+# updated in constant time as endpoints are added or removed
+def _zobrist(endpoints: Iterable[Endpoint]) -> int:
+    sig = 0
+    for e in endpoints:
+        sig ^= e.hash
+    return sig
+
+# a subproblem is a generator that yields the subproblems it depends on and
+# is sent back their solutions, so the search runs on an explicit stack
+# instead of the interpreter's
+_Subproblem = Generator[_SearchState, list, list]
+
+@dataclass
+class SolverStats:
+    expanded: int = 0 # subproblems (DFS) or partial plans (best first) explored
+    cache_hits: int = 0 # memoized searches, the transform cache (DFS) or relaxed costs (best first)
+    cache_misses: int = 0
+    solve_tr_calls: int = 0
+    solve_dep_calls: int = 0
+    apply_cache_hits: int = 0
+    apply_cache_misses: int = 0
+    interned_hits: int = 0 # endpoints made by applying transforms that already existed, see NodeInterner
+    interned_misses: int = 0
+    loop_rejections: int = 0
+    horizon_cutoffs: int = 0
+    gather_visits: int = 0 # input combinations checked
+    gather_combinations: int = 0 # size of the cartesian products they were drawn from
+    shortlist_widenings: int = 0 # times top_k cut what was needed, and a shortlist or the search was widened
+    pruned_transforms: int = 0 # that can never fire from what is given
+    memo_bytes: int = 0 # peak approximate size of the memo tables, see MemoTable
+    memo_evictions: int = 0 # entries dropped from the memo tables to stay within memo_limit
+    memo_invalidated: int = 0 # entries dropped from the memo tables because transforms changed, see _BoundedDfs.Update
+    timed_out: bool = False # the deadline or max_expansions was reached, so plans may be missing or not the best
+    transform_time: dict[str, float] = field(default_factory=dict) # seconds, not including the time spent on requirements
+    trace: bool = False # record spans for ExportTrace
+    _spans: list[tuple[str, str, float, float, dict]] = field(default_factory=list)
+
+    def CacheHitRate(self):
+        total = self.cache_hits+self.cache_misses
+        return self.cache_hits/total if total > 0 else 0.0
+
+    def _add_time(self, transform: str, dt: float):
+        self.transform_time[transform] = self.transform_time.get(transform, 0.0)+dt
+
+    def _add_span(self, name: str, category: str, start: float, end: float, **args):
+        self._spans.append((name, category, start, end, args))
+
+    # from a search in another process, whose spans are not on the same clock
+    def _merge(self, other: SolverStats):
+        for k, v in other.__dict__.items():
+            if k.startswith("_") or k == "trace": continue
+            mine = getattr(self, k)
+            if k == "memo_bytes":
+                setattr(self, k, max(mine, v))
+            elif k == "transform_time":
+                for tr, dt in v.items(): self._add_time(tr, dt)
+            elif isinstance(v, bool):
+                setattr(self, k, mine or v)
+            else:
+                setattr(self, k, mine+v)
+
+    def SlowestTransforms(self, n: int=10):
+        return sorted(self.transform_time.items(), key=lambda x: x[1], reverse=True)[:n]
+
+    def Pack(self):
+        d = {}
+        for k, v in self.__dict__.items():
+            if k.startswith("_"): continue
+            d[k] = v
+        d["cache_hit_rate"] = self.CacheHitRate()
+        return d
+
+    # chrome trace event format, viewable in chrome://tracing or perfetto
+    def ExportTrace(self, path: Path|str|None=None):
+        t0 = min((start for _, _, start, _, _ in self._spans), default=0.0)
+        events = []
+        for name, category, start, end, args in self._spans:
+            events.append(dict(
+                name=name, cat=category, ph="X", pid=0, tid=0,
+                ts=(start-t0)*1e6, dur=(end-start)*1e6,
+                args=args,
+            ))
+        trace = dict(traceEvents=events, displayTimeUnit="ms", otherData=self.Pack())
+        if path is not None:
+            with open(path, "w") as f:
+                json.dump(trace, f)
+        return trace
+
+# a memo table that drops its least recently used entries to stay within a limit
+# on their approximate size. Sizes are shallow, from sizeof, so objects shared
+# between entries or tables are counted by each.
+class MemoTable:
+    def __init__(self, max_bytes: int|None=None, sizeof: Callable[[Any, Any], int]|None=None) -> None:
+        """
+        @max_bytes: no limit if None, only the size is tracked
+        @sizeof: approximate bytes held by an entry, given its key and value
+        """
+        assert max_bytes is None or max_bytes >= 0, f"max_bytes must not be negative but got [{max_bytes}]"
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof if sizeof is not None else lambda k, v: sys.getsizeof(k)+sys.getsizeof(v)
+        self._entries: OrderedDict[Any, tuple[Any, int]] = OrderedDict()
+        self.bytes = 0
+        self.peak_bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, k) -> bool:
+        return k in self._entries
+
+    def Get(self, k, default=None):
+        entry = self._entries.get(k)
+        if entry is None: return default
+        self._entries.move_to_end(k)
+        return entry[0]
+
+    def Put(self, k, v):
+        old = self._entries.pop(k, None)
+        if old is not None: self.bytes -= old[1]
+        size = self._sizeof(k, v)
+        self._entries[k] = v, size
+        self.bytes += size
+        # an entry larger than the limit is dropped along with everything else
+        while self.max_bytes is not None and self.bytes > self.max_bytes and len(self._entries) > 0:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+        self.peak_bytes = max(self.peak_bytes, self.bytes)
+
+    # drops the entries for which stale(key, value) is true, returning how many
+    def Discard(self, stale: Callable[[Any, Any], bool]) -> int:
+        keys = [k for k, (v, _) in self._entries.items() if stale(k, v)]
+        for k in keys:
+            _, size = self._entries.pop(k)
+            self.bytes -= size
+        return len(keys)
+
+    def Clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+class PlanningMode(Enum):
+    DFS =           "dfs"
+    BEST_FIRST =    "best_first"
+
+    def __str__(self) -> str:
+        return f"PlanningMode.{self.name}"
+    
+    def __repr__(self) -> str:
+        return f"{self}"
+
+class PlanObjective(Enum):
+    STEPS =         "steps"
+    COST =          "cost" # total of the steps' weights
+    MAKESPAN =      "makespan" # the slowest chain of dependent steps, if the rest run in parallel
+
+    def __str__(self) -> str:
+        return f"PlanObjective.{self.name}"
+    
+    def __repr__(self) -> str:
+        return f"{self}"
+
+# ranks plans by the weights of their transforms instead of by number of steps
+class PlanCost:
+    def __init__(self, weights: dict[Transform, float|None], objective: PlanObjective|str=PlanObjective.COST, default: float|None=None) -> None:
+        """
+        @default: weight of transforms without one, the mean of the known weights if not given
+        """
+        self.objective = PlanObjective(objective)
+        known = [w for w in weights.values() if w is not None]
+        if default is None: default = sum(known)/len(known) if len(known) > 0 else 1.0
+        self.default = default
+        self.weights = {tr:(default if w is None else w) for tr, w in weights.items()}
+        self.min_weight = min(self.weights.values(), default=default)
+
+    def Of(self, transform: Transform) -> float:
+        return self.weights.get(transform, self.default)
+
+    # applications must be in the order they are run
+    def Plan(self, steps: Iterable[Application]) -> float:
+        if self.objective != PlanObjective.MAKESPAN:
+            return sum(self.Of(appl.transform) for appl in steps)
+        return max(self.Finish(steps).values(), default=0.0)
+
+    # when each endpoint produced by the steps is ready, if they run as soon as their inputs are
+    def Finish(self, steps: Iterable[Application]) -> dict[Endpoint, float]:
+        finish: dict[Endpoint, float] = {}
+        for appl in steps:
+            done = max((finish.get(e, 0.0) for e in appl.used), default=0.0)+self.Of(appl.transform)
+            for e in appl.produced:
+                finish[e] = done
+        return finish
+
+    # an optimistic estimate from the cost so far and a number of steps still needed,
+    # which must run in sequence for the makespan to be bounded by them
+    def Estimate(self, cost: float, steps_needed: int) -> float:
+        if self.objective == PlanObjective.MAKESPAN:
+            return max(cost, steps_needed*self.min_weight)
+        return cost+steps_needed*self.min_weight
+
+# lineage is satisfied at depth 1 (parents of parents are not considered) 
+class _SearchEngine:
+    def __init__(self, producers: ProducerIndex, stats: SolverStats|None=None, debug_print: Callable|None=None, cost: PlanCost|None=None, deadline: float|None=None, max_expansions: int|None=None, memo_limit: int|None=None) -> None:
+        """
+        @deadline: seconds from now, after which no more subproblems are started
+        @max_expansions: likewise, a limit on stats.expanded
+        @memo_limit: approximate bytes for the memo tables, shared evenly between them
+        """
+        self.producers = producers
+        self.cost = cost
+        self.stats = SolverStats() if stats is None else stats
+        self._debugging = debug_print is not None
+        self._debug_print = debug_print
+        self._memo_limit = memo_limit
+        self._tables: list[MemoTable] = []
+        self._apply_cache = self._memo_table(self._sizeof_application)
+        self._interned = (_NODE_INTERNER.hits, _NODE_INTERNER.misses)
+        self._set_budget(deadline, max_expansions)
+
+    def _set_budget(self, deadline: float|None, max_expansions: int|None):
+        self._stop_at = time.perf_counter()+deadline if deadline is not None else None
+        self._max_expanded = self.stats.expanded+max_expansions if max_expansions is not None else None
+        self._timed_out = False
+
+    def _out_of_time(self):
+        if self._timed_out: return True
+        if self._max_expanded is not None and self.stats.expanded >= self._max_expanded:
+            self._timed_out = True
+        elif self._stop_at is not None and time.perf_counter() >= self._stop_at:
+            self._timed_out = True
+        if self._timed_out:
+            self.stats.timed_out = True
+            if self._debugging: self._debug_print(f"!!! TIMEOUT after {self.stats.expanded} expansions")
+        return self._timed_out
+
+    # the limit is split evenly between the tables, and updated as each is added
+    def _memo_table(self, sizeof: Callable[[Any, Any], int]):
+        table = MemoTable(sizeof=sizeof)
+        self._tables.append(table)
+        if self._memo_limit is not None:
+            for t in self._tables:
+                t.max_bytes = self._memo_limit//len(self._tables)
+        return table
+
+    def _report_memo(self):
+        self.stats.memo_bytes = max(self.stats.memo_bytes, sum(t.peak_bytes for t in self._tables))
+        self.stats.memo_evictions += sum(t.evictions for t in self._tables)
+        # the interner is shared by the process, so only what it did since the last report is counted
+        hits, misses = _NODE_INTERNER.hits, _NODE_INTERNER.misses
+        self.stats.interned_hits += hits-self._interned[0]
+        self.stats.interned_misses += misses-self._interned[1]
+        self._interned = (hits, misses)
+
+    @classmethod
+    def _sizeof_application(cls, k: tuple[int, str], appl: Application):
+        size = sys.getsizeof(k)+sys.getsizeof(k[1])+sys.getsizeof(appl)+sys.getsizeof(appl.used)+sys.getsizeof(appl.produced)
+        for e in appl.produced:
+            # endpoints are interned, but their parent maps are kept alive mostly by this table
+            size += sys.getsizeof(e)+sys.getsizeof(e._parent_map)
+        return size
+
+    def _rank(self, x: Result|DependencyResult):
+        return len(x) if self.cost is None else self.cost.Plan(x.Steps())
+
+    def _apply(self, target: Transform, inputs: Iterable[tuple[Endpoint, Node]]):
+        # by identity, as for memoized searches, see _BoundedDfs._memo_key
+        sig  = (id(target) if self.producers.Has(target) else target.hash, "".join(e.key+d.key for e, d in inputs))
+        appl = self._apply_cache.Get(sig)
+        if appl is not None:
+            self.stats.apply_cache_hits += 1
+            return appl
+        self.stats.apply_cache_misses += 1
         appl = target.Apply(inputs)
-        _apply_cache[sig] = appl
+        self._apply_cache.Put(sig, appl)
         return appl
 
-    def _satisfies_lineage(tproto: Dependency, candidate: Endpoint):
+    @classmethod
+    def _satisfies_lineage(cls, tproto: Dependency, candidate: Endpoint):
         for tp_proto in tproto.parents:
-            if all(not p.IsA(tp_proto) for p, _ in candidate.Iterparents()):
+            if candidate.NearestAncestor(tp_proto) is None:
+                return False
+        return True
+
+    @classmethod
+    def _respects_lineage(cls, e: Endpoint, eproto: Node, lineage_requirements: dict[Node, Endpoint]):
+        for rproto, r in lineage_requirements.items():
+            if e == r: continue
+            if eproto.IsA(rproto): # e is protype, but explicitly breaks lineage
+                return False
+            for p in e.BoundAs(rproto):
+                if p != r:
+                    return False
+        return True
+
+    def _accepts_input(self, req: Dependency, res: DependencyResult, deps: dict[Dependency, Endpoint], used: set[Endpoint]):
+        _debug, debug_print = self._debugging, self._debug_print
+        if _debug: debug_print(f"          ", deps)
+        if _debug: debug_print(f"    ___", req, req.parents)
+        if _debug: debug_print(f"        __", res.endpoint, list(res.endpoint.Iterparents()))
+        if res.endpoint in used:
+            if _debug: debug_print(f"    ___ FAIL: duplicate input", res.endpoint)
+            return False
+
+        if not self._satisfies_lineage(req, res.endpoint):
+            if _debug: debug_print(f"    ___ FAIL: unsatisfied lineage", req)
+            return False
+
+        for rproto in req.parents:
+            r = deps[rproto]
+            # in the case of asm -> bin, the closest ancestor takes priority
+            p = res.endpoint.NearestAncestor(rproto)
+            if p is not None and p != r:
+                if _debug: debug_print(f"    ___ FAIL: lineage mismatch", p, r)
                 return False
         return True
 
-    def _solve_dep(s: State) -> list[DependencyResult]:
-        if s.depth >= horizon:
+    # every combination of one result per requirement, in order, that does not reuse
+    # an input and respects the lineage between inputs
+    def _gather_valid_inputs(self, target: Transform, plans: list[list[DependencyResult]]):
+        valids: list[list[DependencyResult]] = []
+        if len(target.requires) == 0: return [[]]
+        visited = 0
+        last = len(target.requires)-1
+        chosen: list[DependencyResult] = []
+        deps: dict[Dependency, Endpoint] = {}
+        used: set[Endpoint] = set()
+        undo: list[tuple[Dependency, Endpoint|None]] = []
+        cursor = [0] # next candidate to try at each requirement
+        while len(cursor) > 0:
+            req_i = len(cursor)-1
+            if cursor[req_i] >= len(plans[req_i]):
+                cursor.pop()
+                if len(chosen) > 0:
+                    res = chosen.pop()
+                    used.discard(res.endpoint)
+                    req, prev = undo.pop()
+                    if prev is None: del deps[req]
+                    else: deps[req] = prev
+                continue
+            res = plans[req_i][cursor[req_i]]
+            cursor[req_i] += 1
+            visited += 1
+            if visited % 1024 == 0 and self._out_of_time(): break
+            req = target.requires[req_i]
+            if not self._accepts_input(req, res, deps, used): continue
+
+            if req_i >= last:
+                valids.append(chosen+[res])
+            else:
+                undo.append((req, deps.get(req)))
+                deps[req] = res.endpoint
+                used.add(res.endpoint)
+                chosen.append(res)
+                cursor.append(0)
+        total = 1
+        for s in plans:
+            total *= len(s)
+        self.stats.gather_visits += visited
+        self.stats.gather_combinations += total
+        if self._debugging: self._debug_print(f"    ## {visited} visited, {total} combos")
+        return valids
+
+class _BoundedDfs(_SearchEngine):
+    def __init__(self, horizon: int, producers: ProducerIndex, top_k: int|None=None, stats: SolverStats|None=None, debug_print: Callable|None=None, cost: PlanCost|None=None, deadline: float|None=None, max_expansions: int|None=None, memo_limit: int|None=None, track: bool=False) -> None:
+        """
+        @track: record the dependencies searched by each memoized search, so that Update can keep those unaffected by changes
+        """
+        super().__init__(producers, stats, debug_print, cost, deadline, max_expansions, memo_limit)
+        assert top_k is None or top_k > 0, f"top_k must be positive but got [{top_k}]"
+        self.horizon = horizon
+        self.top_k = top_k
+        self._transform_cache = self._memo_table(self._sizeof_results)
+        # results of subproblems searched elsewhere, by memo key and depth, see Presolve
+        self._presolved: dict[tuple, list[DependencyResult]] = {}
+        # masks of the dependencies searched by each frame on the stack, if tracking
+        self._track = track
+        self._queried: list[set[int]] = []
+        # memo keys of the _solve_tr frames currently on the stack, for loop detection
+        self._active: set[tuple] = set()
+        # candidates were cut to top_k in what is memoized, see Solve
+        self._truncated = False
+
+    @classmethod
+    def _sizeof_results(cls, k: tuple, entry: tuple[list[Result], frozenset[int]|None]):
+        # applications are counted by the apply cache
+        results, queried = entry
+        size = sys.getsizeof(k)+sys.getsizeof(results)+sys.getsizeof(queried)
+        for r in results:
+            size += sys.getsizeof(r)+sys.getsizeof(r.dependency_plan)
+        return size
+
+    # combinations of the top_k cheapest candidates of each requirement. If those are not
+    # compatible in lineage, the shortlists are widened in steps of k, 2k, 4k and so on,
+    # rather than to every candidate, so that the combinations searched stay bounded
+    def _gather_shortlisted(self, target: Transform, plans: list[list[DependencyResult]]):
+        plans = [sorted(x, key=self._rank) for x in plans]
+        width = self.top_k
+        while True:
+            valid_inputs = self._gather_valid_inputs(target, [x[:width] for x in plans])
+            cut = any(len(x) > width for x in plans)
+            if len(valid_inputs) > 0 or not cut or self._out_of_time():
+                if cut: self._truncated = True
+                return valid_inputs
+            self.stats.shortlist_widenings += 1
+            width *= 2
+
+    def _start(self, s: _SearchState) -> _Subproblem:
+        return self._solve_tr(s) if isinstance(s.target, Transform) else self._solve_dep(s)
+
+    # subproblems yield the states they depend on and receive the results,
+    # so that deep plans are not limited by the recursion limit.
+    # Time is charged to the transform of the running frame, or to the
+    # transform that requires it for dependencies.
+    def Run(self, root: _SearchState):
+        stats, clock = self.stats, time.perf_counter
+        stack: list[tuple[_Subproblem, _SearchState, str, float]] = [(self._start(root), root, str(root.target), clock())]
+        track, queried = self._track, self._queried
+        if track: queried.append(set() if isinstance(root.target, Transform) else {root.target.mask})
+        value = None
+        last = clock()
+        while len(stack) > 0:
+            frame, s, label, began = stack[-1]
+            try:
+                sub = frame.send(value)
+            except StopIteration as done:
+                stack.pop()
+                value = done.value
+                if track:
+                    searched = queried.pop()
+                    if len(queried) > 0: queried[-1] |= searched
+                now = clock()
+                if stats.trace:
+                    kind = "solve_tr" if isinstance(s.target, Transform) else "solve_dep"
+                    stats._add_span(str(s.target), kind, began, now, depth=s.depth, solutions=len(value))
+            else:
+                now = clock()
+                presolved = self._presolved.get((sub.MemoKey(), sub.depth)) if len(self._presolved) > 0 else None
+                if presolved is not None:
+                    value = presolved
+                    if track: queried[-1].add(0) # unknown, so affected by any change
+                elif self._out_of_time():
+                    value = [] # unwinds with the complete plans found so far
+                else:
+                    is_tr = isinstance(sub.target, Transform)
+                    sub_label = str(sub.target) if is_tr else label
+                    stack.append((self._start(sub), sub, sub_label, now))
+                    if track: queried.append(set() if is_tr else {sub.target.mask})
+                    value = None
+            stats._add_time(label, now-last)
+            last = now
+        return value
+
+    def _solve_dep(self, s: _SearchState) -> _Subproblem:
+        _debug, debug_print = self._debugging, self._debug_print
+        self.stats.expanded += 1
+        self.stats.solve_dep_calls += 1
+        if s.depth >= self.horizon:
+            self.stats.horizon_cutoffs += 1
             if _debug: debug_print(f" <-  HORIZON", s.depth)
             return []
         target: Dependency = s.target
@@ -422,26 +1161,12 @@ def _solve_by_bounded_dfs(given: Iterable[Endpoint], target: Transform, transfor
         candidates:list[DependencyResult] = []
         for e, eproto in s.have.items():
             if not e.IsA(target): continue
-            acceptable = True
-            for rproto, r in s.lineage_requirements.items():
-                if e == r: continue
-                if eproto.IsA(rproto): # e is protype, but explicitly breaks lineage
-                    acceptable=False; break
-
-                for p, pproto in e.Iterparents():
-                    if rproto.IsA(pproto):
-                        if p != r:
-                            acceptable=False; break
-
-            if not acceptable:
+            if not self._respects_lineage(e, eproto, s.lineage_requirements):
                 continue
             else:
                 if _debug: debug_print(f"    ^candidate", e, eproto, e.parents)
                 if _debug: debug_print(f"    ^reqs.    ", s.lineage_requirements)
                 candidates.append(DependencyResult([], e))
-            # elif quality == 2:
-            #     if DEBUG: debug_print(f" <-", s.target, e, "DIRECT")
-            #     return [DepResult(0, [], e)]
 
         def _add_result(res: Result):
             ep: Endpoint|None = None
@@ -449,23 +1174,30 @@ def _solve_by_bounded_dfs(given: Iterable[Endpoint], target: Transform, transfor
                 if e.IsA(target):
                     ep = e; break
             assert isinstance(ep, Endpoint)
-            if not _satisfies_lineage(target, ep): return
+            if not self._satisfies_lineage(target, ep): return
             candidates.append(DependencyResult(
                 res.dependency_plan+[res.application],
                 ep,
             ))
 
-        for tr in _get_producers_of(target):
-            # if target in tr.deletes: continue
-            results = _solve_tr(State(s.have, s.needed, tr, s.lineage_requirements, s.seen_signatures, s.depth))
+        for tr in self.producers.ProducersOf(target):
+            results = yield _SearchState(s.have, tr, s.lineage_requirements, s.depth, s.have_sig, s.lineage_sig)
             for res in results:
                 _add_result(res)
 
         if _debug: debug_print(f" <-", s.target, f"{len(candidates)} sol.", candidates[0].endpoint if len(candidates)>0 else None)
         return candidates
 
-    _transform_cache: dict[str, list[Result]] = {}
-    def _solve_tr(s: State) -> list[Result]:
+    # producers by identity, since interchangeable ones have the same hash but may differ in cost.
+    # Other transforms, like the root that is made again for each request, by hash
+    def _memo_key(self, s: _SearchState):
+        tr = s.target
+        return s.have_sig, (id(tr) if self.producers.Has(tr) else tr.hash), s.lineage_sig
+
+    def _solve_tr(self, s: _SearchState) -> _Subproblem:
+        _debug, debug_print = self._debugging, self._debug_print
+        self.stats.expanded += 1
+        self.stats.solve_tr_calls += 1
         assert isinstance(s.target, Transform), f"{s.target} not tr"
         target: Transform = s.target
         if _debug: debug_print(f">>>{s.depth:02}", s.target, s.lineage_requirements)
@@ -473,109 +1205,514 @@ def _solve_by_bounded_dfs(given: Iterable[Endpoint], target: Transform, transfor
             if _debug: debug_print(f"      ", h)
 
         # memoization
-        sig = "".join(e.key for e in s.have)
-        sig += f":{s.target.key}"
-        sig += ":"+"".join(e.key for e in s.lineage_requirements.values())
-        if sig in _transform_cache:
-            if _debug: debug_print(f"<<<{s.depth:02} CACHED: {len(_transform_cache[sig])} solutions")
-            return _transform_cache[sig]
-        if sig in s.seen_signatures:
+        sig = self._memo_key(s)
+        cached = self._transform_cache.Get(sig)
+        if cached is not None:
+            cached, searched = cached
+            if self._track: self._queried[-1].update(searched)
+            self.stats.cache_hits += 1
+            if _debug: debug_print(f"<<<{s.depth:02} CACHED: {len(cached)} solutions")
+            return cached
+        self.stats.cache_misses += 1
+        if sig in self._active:
+            # what rejects the loop may change, so also depend on what it would have searched
+            if self._track: self._queried[-1].update(req.mask for req in target.requires)
+            self.stats.loop_rejections += 1
             if _debug: debug_print(f"<<<{s.depth:02} FAIL: is loop")
             return []
 
-        plans: list[list[DependencyResult]] = []
-        for i, req in enumerate(s.target.requires):
-            req_p = {}
-            for proto, e in s.lineage_requirements.items():
-                if req.IsA(proto): continue
-                req_p[proto] = e
-
-            results = _solve_dep(State(s.have, s.needed|{req}, req, req_p, s.seen_signatures|{sig}, s.depth+1))
-            
-            if len(results) == 0:
-                if _debug: debug_print(f"<<< FAIL", s.target, req)
-                return []
-            else:
-                plans.append(results)
+        self._active.add(sig)
+        try:
+            plans: list[list[DependencyResult]] = []
+            for i, req in enumerate(target.requires):
+                req_p = {}
+                for proto, e in s.lineage_requirements.items():
+                    if req.IsA(proto): continue
+                    req_p[proto] = e
+                lineage_sig = tuple(e.hash for e in req_p.values())
 
-        def _gather_valid_inputs():
-            valids: list[list[DependencyResult]] = []
-            ii = 0
-            def _gather(req_i: int, req: Dependency, res: DependencyResult, deps: dict, used: set[Endpoint], inputs: list[DependencyResult]):
-                nonlocal ii; ii += 1         
-                if _debug: debug_print(f"          ", deps)
-                if _debug: debug_print(f"    ___", req, req.parents)
-                if _debug: debug_print(f"        __", res.endpoint, list(res.endpoint.Iterparents()))
-                if res.endpoint in used:
-                    if _debug: debug_print(f"    ___ FAIL: duplicate input", res.endpoint)
-                    return
-                # used.add(res.endpoint)
-
-                if not _satisfies_lineage(req, res.endpoint):
-                    if _debug: debug_print(f"    ___ FAIL: unsatisfied lineage", req)
-                    return
-
-                for rproto in req.parents:
-                    r = deps[rproto]
-                    # if all(not p.IsA(rproto) for p, pproto in res.endpoint.Iterparents()):
-                    #     if DEBUG: debug_print(f"    ___ FAIL: unsatisfied lineage", rproto)
-                    #     _fail=True; break
-                    res_parents = list(res.endpoint.Iterparents())
-                    res_parents.reverse()
-                    for p, pproto in res_parents:
-                        if not p.IsA(rproto): continue
-                        if p!=r:
-                            if _debug: debug_print(f"    ___ FAIL: lineage mismatch", p, r)
-                            return
-                        else:
-                            break # in the case of asm -> bin, the closest ancestor takes priority
-                # deps[req] = res.endpoint
-
-                if req_i >= len(target.requires)-1:
-                    valids.append(inputs+[res])
-                else:
-                    req_i += 1
-                    for i, next_res in enumerate(plans[req_i]):
-                        _gather(req_i, target.requires[req_i], next_res, deps|{req:res.endpoint}, used|{res.endpoint}, inputs+[res])
-            req_i = 0
-            for i, next_res in enumerate(plans[req_i]):
-                _gather(0, target.requires[req_i], next_res, {}, set(), [])
-            total = 1
-            for s in plans:
-                total *= len(s)
-            if _debug: debug_print(f"    ## {ii} visited, {total} combos")
-            return valids
+                results = yield _SearchState(s.have, req, req_p, s.depth+1, s.have_sig, lineage_sig)
+                
+                if len(results) == 0:
+                    if _debug: debug_print(f"<<< FAIL", s.target, req)
+                    return []
+                plans.append(results)
+        finally:
+            self._active.discard(sig)
 
         if _debug: debug_print(f"<<<{s.depth:02}", s.target, s.lineage_requirements)
         if _debug: debug_print(f"     ", [len(x) for x in plans])
+        if self.top_k is not None:
+            valid_inputs = self._gather_shortlisted(target, plans)
+        else:
+            valid_inputs = self._gather_valid_inputs(target, plans)
+
         solutions: list[Result] = []
-        # for inputs in _iter_satisfies():
-        for inputs in _gather_valid_inputs():
-            my_appl = _apply(s.target, [(res.endpoint, req) for req, res in zip(s.target.requires, inputs)])
+        for i, inputs in enumerate(valid_inputs):
+            if i % 256 == 255 and self._out_of_time(): break
+            my_appl = self._apply(target, [(res.endpoint, req) for req, res in zip(target.requires, inputs)])
             consolidated_plan: list[Application] = []
-            produced_sigs: set[str] = {p.Signature() for p in my_appl.produced}
-            # if DEBUG: debug_print(f"   __", my_appl)
+            produced_sigs: set[int] = {p.hash for p in my_appl.produced}
             for res in inputs:
                 for appl in res.plan:
-                    if all(p.Signature() in produced_sigs for p in appl.produced): continue
+                    if all(p.hash in produced_sigs for p in appl.produced): continue
                     consolidated_plan.append(appl)
-                    produced_sigs = produced_sigs.union(p.Signature() for p in appl.produced)
+                    produced_sigs.update(p.hash for p in appl.produced)
             solutions.append(Result(
                 my_appl,
                 consolidated_plan,
             ))
-            # if DEBUG: debug_print(f"    *", my_appl)
-            # if DEBUG: debug_print(f"     ", [res.endpoint for res in inputs])
-            # if DEBUG: debug_print(f"    .", target.requires)
-            # for appl in consolidated_plan:
-            #     if DEBUG: debug_print(f"    __", appl)
         if _debug: debug_print(f"     ", f"{len(solutions)} sol.", solutions[0].application.produced if len(solutions)>0 else None)
-        solutions = sorted(solutions, key=lambda s: len(s))
-        _transform_cache[sig] = solutions
+        solutions = sorted(solutions, key=self._rank)
+        if self.top_k is not None and len(solutions) > self.top_k:
+            solutions = solutions[:self.top_k]
+            self._truncated = True
+        if not self._timed_out: # could be missing solutions
+            self._transform_cache.Put(sig, (solutions, frozenset(self._queried[-1]) if self._track else None))
         return solutions
 
+    # the dependencies to search in parallel and their depth: the target's requirements or, if it
+    # has only 1, like the root that Generate makes for a single target, those of its producers.
+    # Neither have lineage requirements, since the root has none, see _solve_tr
+    def _parallel_frontier(self, target: Transform):
+        reqs, depth = list(target.requires), 1
+        if len(reqs) != 1: return reqs, depth
+        below: dict[int, Dependency] = {}
+        for tr in self.producers.ProducersOf(reqs[0]):
+            for req in tr.requires:
+                below.setdefault(req.hash, req)
+        if len(below) > 1: reqs, depth = list(below.values()), 2
+        return reqs, depth
+
+    # searches the frontier's dependencies in worker processes, for Solve to use
+    # instead of searching them itself. Each is searched with its own memo tables,
+    # so subproblems shared between them are searched again, and without the
+    # frames above it for loop detection, so that more plans may be found.
+    def Presolve(self, given: Iterable[Endpoint], target: Transform, workers: int):
+        reqs, depth = self._parallel_frontier(target)
+        if len(reqs) < 2:
+            Log.Warn(f"ignoring [{workers}] workers, as [{target}] can not be split into parallel searches")
+            return
+        given = list(dict.fromkeys(given)) # without duplicates, as in Solve, whose keys must match
+        have_sig = _zobrist(given)
+        stop_at = time.time()+(self._stop_at-time.perf_counter()) if self._stop_at is not None else None
+        max_expansions = None
+        if self._max_expanded is not None:
+            max_expansions = max(0, self._max_expanded-self.stats.expanded)//len(reqs)
+        transforms = self.producers.transforms
+        init = (given, transforms, self.horizon, self.top_k, self.cost, self._memo_limit)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init) as pool:
+            futures = [pool.submit(_solve_in_worker, req, depth, stop_at, max_expansions) for req in reqs]
+            for req, future in zip(reqs, futures):
+                packed, stats, truncated = future.result()
+                if truncated: self._truncated = True
+                self._presolved[((have_sig, req.hash, tuple()), depth)] = _unpack_results(packed, transforms)
+                self.stats._merge(stats)
+                if stats.timed_out: self._timed_out = True
+        if self._debugging: self._debug_print(f"### presolved {len(reqs)} dependencies at depth {depth} with {workers} workers")
+
+    # for searching again after the transforms changed, keeping the memoized searches
+    # that could not have involved those added, removed or reweighted.
+    # Transforms that did not change must be the same objects, as they compare by identity.
+    def Update(self, transforms: Iterable[Transform], stats: SolverStats|None=None, cost: PlanCost|None=None, deadline: float|None=None, max_expansions: int|None=None):
+        transforms = list(transforms)
+        before = {id(tr):tr for tr in self.producers.transforms}
+        after = {id(tr):tr for tr in transforms}
+        changed = [tr for k, tr in before.items() if k not in after]+[tr for k, tr in after.items() if k not in before]
+        if (self.cost is None) != (cost is None): # plans are ranked differently
+            changed = list(before.values())+list(after.values())
+        elif cost is not None:
+            changed += [tr for k, tr in after.items() if k in before and cost.Of(tr) != self.cost.Of(tr)]
+
+        # a memoized search is affected if a changed transform could make a dependency
+        # it searched, as the transform would then have been one of its producers
+        products = {p.mask for tr in changed for p in tr.produces}
+        changed_ids = {id(tr) for tr in changed}
+        def _stale_search(k, entry: tuple[list[Result], frozenset[int]|None]):
+            results, searched = entry
+            if searched is None or k[1] in changed_ids: return True
+            if any(id(r.application.transform) in changed_ids for r in results): return True
+            return any(p & m == m for m in searched for p in products)
+        invalidated = self._transform_cache.Discard(_stale_search)
+        self._apply_cache.Discard(lambda k, appl: k[0] in changed_ids)
+
+        if stats is not None: self.stats = stats
+        self.stats.memo_invalidated += invalidated
+        if not self.producers.IsFor(transforms): self.producers = ProducerIndex(transforms)
+        self.cost = cost
+        self._presolved.clear()
+        self._set_budget(deadline, max_expansions)
+        if self._debugging: self._debug_print(f"### {len(changed)} transforms changed, {invalidated} memoized searches dropped")
+        return changed, invalidated
+
+    # the candidates cut by top_k may be needed deeper in the plan, as for lineage, so
+    # if there are no plans, the whole search is repeated with twice the top_k, and so on
+    # until nothing is cut. Searches memoized with a larger top_k are kept afterwards.
+    def Solve(self, given: Iterable[Endpoint], target: Transform) -> list[Result]:
+        input_tr = Transform()
+        given_dict = {g:input_tr.AddProduct(properties=g.properties) for g in given}
+        root = _SearchState(given_dict, target, {}, 0, _zobrist(given_dict))
+        top_k = self.top_k
+        try:
+            while True:
+                res = self.Run(root)
+                if len(res) > 0 or not self._truncated or self._out_of_time(): break
+                self.top_k *= 2
+                self.stats.shortlist_widenings += 1
+                if self._debugging: self._debug_print(f"### no plans, searching again with top_k of {self.top_k}")
+                self._transform_cache.Clear()
+                self._presolved.clear()
+                self._truncated = False
+        finally:
+            self.top_k = top_k
+        self._report_memo()
+        return res
+
+# the search space of a worker process, see _BoundedDfs.Presolve
+_WORKER: dict[str, Any] = {}
+
+def _init_worker(given: list[Endpoint], transforms: list[Transform], horizon: int, top_k: int|None, cost: PlanCost|None, memo_limit: int|None):
     input_tr = Transform()
     given_dict = {g:input_tr.AddProduct(properties=g.properties) for g in given}
-    res = _solve_tr(State(given_dict, set(), target, {}, set(), 0))
+    _WORKER.update(
+        have=given_dict,
+        have_sig=_zobrist(given_dict),
+        producers=ProducerIndex(transforms),
+        index={id(tr):i for i, tr in enumerate(transforms)},
+        horizon=horizon, top_k=top_k, cost=cost, memo_limit=memo_limit,
+    )
+
+def _solve_in_worker(req: Dependency, depth: int, stop_at: float|None, max_expansions: int|None):
+    w = _WORKER
+    stats = SolverStats()
+    deadline = max(0.0, stop_at-time.time()) if stop_at is not None else None
+    engine = _BoundedDfs(
+        horizon=w["horizon"], producers=w["producers"], top_k=w["top_k"], stats=stats,
+        cost=w["cost"], deadline=deadline, max_expansions=max_expansions, memo_limit=w["memo_limit"],
+    )
+    results = engine.Run(_SearchState(w["have"], req, {}, depth, w["have_sig"]))
+    engine._report_memo()
+    return _pack_results(results, w["index"]), stats, engine._truncated
+
+# transforms have no equality but identity, so results are sent back with
+# transforms by position in the list given to the worker, and each
+# application once, however many plans share it
+def _pack_results(results: list[DependencyResult], index: dict[int, int]):
+    applications: list[tuple[int, dict, dict]] = []
+    ids: dict[int, int] = {}
+    def _id(appl: Application):
+        i = ids.get(id(appl))
+        if i is None:
+            i = ids[id(appl)] = len(applications)
+            applications.append((index[id(appl.transform)], appl.used, appl.produced))
+        return i
+    return applications, [([_id(a) for a in r.plan], r.endpoint) for r in results]
+
+def _unpack_results(packed: tuple[list, list], transforms: list[Transform]):
+    applications, results = packed
+    applications = [Application(transforms[i], used, produced) for i, used, produced in applications]
+    return [DependencyResult([applications[i] for i in plan], e) for plan, e in results]
+
+# cheapest number of steps to reach each property mask from the available ones,
+# ignoring lineage and taking the most expensive input of each transform (h_max),
+# so that the cost of reaching any mask is never overestimated
+def _relaxed_costs(available: Iterable[int], transforms: Iterable[Transform]) -> dict[int, int]:
+    costs = {m:0 for m in available}
+    transforms = list(transforms)
+    changed = True
+    while changed:
+        changed = False
+        for tr in transforms:
+            fire = max((_relaxed_cost_of(costs, req.mask) for req in tr.requires), default=0)
+            if fire == math.inf: continue
+            for p in tr.produces:
+                if costs.get(p.mask, math.inf) <= fire+1: continue
+                costs[p.mask] = fire+1
+                changed = True
+    return costs
+
+def _relaxed_cost_of(costs: dict[int, int], mask: int):
+    return min((c for m, c in costs.items() if m & mask == mask), default=math.inf)
+
+# forward fixpoint over property masks from what is given, ignoring lineage, so
+# it overestimates what can be made. Returns the masks made available and the
+# transforms that can fire, in their original order.
+def _forward_reachable(given: Iterable[Node], transforms: Iterable[Transform]) -> tuple[set[int], list[Transform]]:
+    transforms = list(transforms)
+    waiting: dict[int, list[int]] = {} # requirement mask: transforms that need it
+    missing: list[int] = [] # number of unsatisfied requirement masks of each transform
+    for i, tr in enumerate(transforms):
+        masks = {req.mask for req in tr.requires}
+        missing.append(len(masks))
+        for m in masks:
+            waiting.setdefault(m, []).append(i)
+
+    available = {e.mask for e in given}
+    frontier = list(available)
+    fired = [n == 0 for n in missing]
+    ready = [i for i, n in enumerate(missing) if n == 0]
+    while len(frontier) > 0 or len(ready) > 0:
+        while len(frontier) > 0:
+            a = frontier.pop()
+            for m in [m for m in waiting if a & m == m]:
+                for i in waiting.pop(m):
+                    missing[i] -= 1
+                    if missing[i] > 0: continue
+                    fired[i] = True
+                    ready.append(i)
+        while len(ready) > 0:
+            for p in transforms[ready.pop()].produces:
+                if p.mask in available: continue
+                available.add(p.mask)
+                frontier.append(p.mask)
+    return available, [tr for tr, f in zip(transforms, fired) if f]
+
+def _unreachable(available: set[int], target: Transform) -> list[Dependency]:
+    return [req for req in target.requires if not any(a & req.mask == req.mask for a in available)]
+
+# drops transforms that can never fire, or returns None if the target can not be reached
+def _prune(given: list[Endpoint], target: Transform, transforms: list[Transform], stats: SolverStats):
+    available, reachable = _forward_reachable(given, transforms)
+    stats.pruned_transforms += len(transforms)-len(reachable)
+    if len(_unreachable(available, target)) > 0: return None
+    return reachable
+
+# a transform waiting for its requirements, which are bound in order
+@dataclass(frozen=True, slots=True)
+class _PendingTransform:
+    transform: Transform
+    lineage_requirements: tuple[tuple[Node, Endpoint], ...]
+    depth: int
+    bound: tuple[Endpoint, ...] = tuple()
+
+    def Next(self):
+        return self.transform.requires[len(self.bound)] if len(self.bound) < len(self.transform.requires) else None
+
+@dataclass(slots=True)
+class _PartialPlan:
+    have: dict[Endpoint, Node]
+    have_sig: int # see _zobrist
+    plan: tuple[Application, ...]
+    agenda: tuple[_PendingTransform, ...] # a stack, the target is at the bottom
+    goal: Application|None = None
+
+    def __len__(self):
+        return len(self.plan)
+
+# A* over partial plans that works backward from the target, making the same choices
+# as the bounded DFS, but one at a time and cheapest first: each requirement is bound
+# to an available endpoint or delegated to a producer, which is applied once its own
+# requirements are bound. The heuristic is the larger of the number of pending
+# producers and the relaxed cost of the hardest unbound requirement.
+class _BestFirst(_SearchEngine):
+    def __init__(self, horizon: int, producers: ProducerIndex, stats: SolverStats|None=None, debug_print: Callable|None=None, cost: PlanCost|None=None, deadline: float|None=None, max_expansions: int|None=None, memo_limit: int|None=None) -> None:
+        super().__init__(producers, stats, debug_print, cost, deadline, max_expansions, memo_limit)
+        self.horizon = horizon
+        self._relaxed_cache: dict[frozenset[int], dict[int, int]] = {}
+        self._relaxed_by_have: dict[int, dict[int, int]] = {}
+        self._relevant: list[Transform] = []
+
+    def _relevant_to(self, target: Transform):
+        order = {id(tr):i for i, tr in enumerate(self.producers.transforms)}
+        relevant: dict[int, Transform] = {}
+        seen: set[int] = set()
+        frontier: list[Dependency] = list(target.requires)
+        while len(frontier) > 0:
+            d = frontier.pop()
+            if d.mask in seen: continue
+            seen.add(d.mask)
+            for tr in self.producers.ProducersOf(d):
+                if id(tr) in relevant: continue
+                relevant[id(tr)] = tr
+                frontier.extend(tr.requires)
+        return sorted(relevant.values(), key=lambda tr: order[id(tr)])
+
+    def _relaxed(self, node: _PartialPlan):
+        costs = self._relaxed_by_have.get(node.have_sig)
+        if costs is not None:
+            self.stats.cache_hits += 1
+            return costs
+        # distinct endpoints often share masks, so fall back to those before solving
+        k = frozenset(e.mask for e in node.have)
+        if k in self._relaxed_cache:
+            self.stats.cache_hits += 1
+        else:
+            self.stats.cache_misses += 1
+            self._relaxed_cache[k] = _relaxed_costs(k, self._relevant)
+        costs = self._relaxed_by_have[node.have_sig] = self._relaxed_cache[k]
+        return costs
+
+    def _heuristic(self, node: _PartialPlan):
+        if node.goal is not None: return 0
+        costs = self._relaxed(node)
+        hardest = 0
+        for i, pending in enumerate(node.agenda):
+            # the requirement a lower transform is delegated to is paid for by the one above it
+            first = len(pending.bound) if i == len(node.agenda)-1 else len(pending.bound)+1
+            for req in pending.transform.requires[first:]:
+                hardest = max(hardest, _relaxed_cost_of(costs, req.mask))
+        return max(len(node.agenda)-1, hardest)
+
+    # the heuristic counts steps, so is scaled by the cheapest transform for costs
+    def _cost_so_far(self, node: _PartialPlan):
+        return len(node) if self.cost is None else self.cost.Plan(node.plan)
+
+    # what the rest of a plan costs depends only on its cost so far, except for the makespan, which
+    # depends on when each endpoint is ready. A state reached with no better progress is not expanded again
+    def _progress(self, node: _PartialPlan, g: float) -> tuple[float, ...]:
+        if self.cost is None or self.cost.objective != PlanObjective.MAKESPAN: return (g,)
+        finish = self.cost.Finish(node.plan)
+        return tuple(finish.get(e, 0.0) for e in sorted(node.have, key=hash))
+
+    # (f, g), so that among equal estimates, as are common for the makespan, which only
+    # grows past the estimate of the remaining steps, the partial plan that costs less so far is first.
+    # Otherwise the first of interchangeable producers to reach a state would close it.
+    def _priority(self, node: _PartialPlan, h: int):
+        g = self._cost_so_far(node)
+        if self.cost is None: return g+h, g
+        return self.cost.Estimate(g, h), g
+
+    def _bind(self, pending: _PendingTransform, e: Endpoint):
+        tr = pending.transform
+        deps = {req:b for req, b in zip(tr.requires, pending.bound)}
+        res = DependencyResult([], e)
+        if not self._accepts_input(pending.Next(), res, deps, set(pending.bound)): return None
+        return _PendingTransform(pending.transform, pending.lineage_requirements, pending.depth, pending.bound+(e,))
+
+    def _expand(self, node: _PartialPlan):
+        _debug, debug_print = self._debugging, self._debug_print
+        pending = node.agenda[-1]
+        req = pending.Next()
+        if req is None: # all requirements bound
+            tr = pending.transform
+            appl = self._apply(tr, list(zip(pending.bound, tr.requires)))
+            rest = node.agenda[:-1]
+            if len(rest) == 0:
+                yield _PartialPlan(node.have, node.have_sig, node.plan, rest, goal=appl)
+                return
+            parent = rest[-1]
+            preq = parent.Next()
+            ep = next(e for e in appl.produced if e.IsA(preq))
+            if not self._satisfies_lineage(preq, ep): return
+            bound = self._bind(parent, ep)
+            if bound is None: return
+            if _debug: debug_print(f"    applied", appl)
+            have_sig = node.have_sig^_zobrist(e for e in appl.produced if e not in node.have)
+            yield _PartialPlan(node.have|appl.produced, have_sig, node.plan+(appl,), rest[:-1]+(bound,))
+            return
+
+        depth = pending.depth+1
+        if depth >= self.horizon:
+            self.stats.horizon_cutoffs += 1
+            if _debug: debug_print(f" <-  HORIZON", depth)
+            return
+        lineage_requirements = dict(pending.lineage_requirements)
+        for e, eproto in node.have.items():
+            if not e.IsA(req): continue
+            if not self._respects_lineage(e, eproto, lineage_requirements): continue
+            bound = self._bind(pending, e)
+            if bound is None: continue
+            yield _PartialPlan(node.have, node.have_sig, node.plan, node.agenda[:-1]+(bound,))
+
+        req_p = tuple((proto, e) for proto, e in pending.lineage_requirements if not req.IsA(proto))
+        for tr in self.producers.ProducersOf(req):
+            delegate = _PendingTransform(tr, req_p, depth)
+            if any(p.transform is tr and p.lineage_requirements == req_p for p in node.agenda):
+                self.stats.loop_rejections += 1
+                if _debug: debug_print(f"    FAIL: is loop", tr)
+                continue
+            yield _PartialPlan(node.have, node.have_sig, node.plan, node.agenda+(delegate,))
+
+    def Solve(self, given: Iterable[Endpoint], target: Transform) -> list[Result]:
+        res = self._search(given, target)
+        self._report_memo()
+        return res
+
+    def _search(self, given: Iterable[Endpoint], target: Transform) -> list[Result]:
+        _debug, debug_print = self._debugging, self._debug_print
+        input_tr = Transform()
+        given_dict = {g:input_tr.AddProduct(properties=g.properties) for g in given}
+        self._relevant = self._relevant_to(target)
+
+        tie = 0 # among equal costs, the most recent first
+        start = _PartialPlan(given_dict, _zobrist(given_dict), tuple(), (_PendingTransform(target, tuple(), 0),))
+        frontier = [(*self._priority(start, self._heuristic(start)), tie, start)]
+        # the progress with which each state was expanded, see _progress. The makespan's estimate is
+        # not consistent, as a step in parallel adds nothing to the cost but a step less to the estimate,
+        # so a state may be reached with better progress after it was expanded, and is then expanded again
+        closed: dict[tuple, list[tuple[float, ...]]] = {}
+        while len(frontier) > 0:
+            f, g, _, node = heapq.heappop(frontier)
+            if node.goal is not None:
+                if _debug: debug_print(f"<<< DONE", node.goal)
+                return [Result(node.goal, list(node.plan))]
+            k = (node.have_sig, node.agenda)
+            progress = self._progress(node, g)
+            expanded = closed.setdefault(k, [])
+            if any(all(a <= b for a, b in zip(other, progress)) for other in expanded): continue
+            if self._out_of_time(): break
+            expanded.append(progress)
+            self.stats.expanded += 1
+            if _debug: debug_print(f">>> f={f} g={g}", node.agenda[-1].transform, len(node.agenda[-1].bound))
+
+            began = time.perf_counter()
+            for child in self._expand(node):
+                h = self._heuristic(child)
+                if h == math.inf: continue
+                tie -= 1
+                heapq.heappush(frontier, (*self._priority(child, h), tie, child))
+            now = time.perf_counter()
+            label = str(node.agenda[-1].transform)
+            self.stats._add_time(label, now-began)
+            if self.stats.trace: self.stats._add_span(label, "expand", began, now, f=f, g=g)
+        return []
+
+def _debug_log(_debug: bool):
+    if not _debug: return None
+    log_path = Path("./cache/debug_log.txt")
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    log = open("./cache/debug_log.txt", "w")
+    return lambda *args: log.write(" ".join(str(a) for a in args)+"\n") if args[0] != "END" else log.close()
+
+# top_k combines only the k shortest candidates per requirement, widening in steps if they are
+# incompatible, and keeps the k shortest results per transform.
+# Given a cost, shortest means cheapest. Out of time (see stats.timed_out),
+# returns the complete plans found so far.
+# memo_limit bounds the memo tables in bytes, evicting the least recently used,
+# which trades repeated searches for memory. With more than 1 worker, the
+# target's requirements, or those of its producers if it has only 1, are searched in parallel processes.
+def _solve_by_bounded_dfs(given: Iterable[Endpoint], target: Transform, transforms: Iterable[Transform], horizon: int=64, producers: ProducerIndex|None=None, top_k: int|None=None, stats: SolverStats|None=None, prune: bool=True, cost: PlanCost|None=None, deadline: float|None=None, max_expansions: int|None=None, memo_limit: int|None=None, workers: int|None=None, _debug=False):
+    given, transforms = list(given), list(transforms)
+    if stats is None: stats = SolverStats()
+    if producers is None or not producers.IsFor(transforms):
+        producers = ProducerIndex(transforms)
+    if prune:
+        reachable = _prune(given, target, transforms, stats)
+        if reachable is None: return []
+        producers = producers.Pruned(reachable)
+
+    debug_print = _debug_log(_debug)
+    engine = _BoundedDfs(horizon=horizon, producers=producers, top_k=top_k, stats=stats, debug_print=debug_print, cost=cost, deadline=deadline, max_expansions=max_expansions, memo_limit=memo_limit)
+    if workers is not None and workers > 1:
+        engine.Presolve(given, target, workers)
+    res = engine.Solve(given, target)
+    if _debug: debug_print("END")
+    return res
+
+# returns at most 1 result, the plan with the fewest steps, or the cheapest given a cost.
+# Out of time, returns nothing, since partial plans are not complete.
+def _solve_best_first(given: Iterable[Endpoint], target: Transform, transforms: Iterable[Transform], horizon: int=64, producers: ProducerIndex|None=None, stats: SolverStats|None=None, prune: bool=True, cost: PlanCost|None=None, deadline: float|None=None, max_expansions: int|None=None, memo_limit: int|None=None, _debug=False):
+    given, transforms = list(given), list(transforms)
+    if stats is None: stats = SolverStats()
+    if producers is None or not producers.IsFor(transforms):
+        producers = ProducerIndex(transforms)
+    if prune:
+        reachable = _prune(given, target, transforms, stats)
+        if reachable is None: return []
+        producers = producers.Pruned(reachable)
+
+    debug_print = _debug_log(_debug)
+    engine = _BestFirst(horizon=horizon, producers=producers, stats=stats, debug_print=debug_print, cost=cost, deadline=deadline, max_expansions=max_expansions, memo_limit=memo_limit)
+    res = engine.Solve(given, target)
     if _debug: debug_print("END")
     return res
@@ -1,17 +1,23 @@
-from dataclasses import dataclass, field
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Iterable
+from typing import Callable, Iterable
+import os
+import re
+import statistics
 import yaml
 from .libraries import DataTypeLibrary
 from .libraries import DataInstanceLibrary, DataInstance
-from .libraries import TransformInstance, TransformInstanceLibrary
+from .libraries import TransformInstance, TransformInstanceLibrary, TransformCost
 from .libraries import ExecutionContext, ExecutionResult
 from .remote import Logistics, Source, SourceType
-from .solver import Endpoint, Dependency, Transform, _solve_by_bounded_dfs
+from .solver import Endpoint, Dependency, Transform, PlanningMode, PlanObjective, PlanCost, SolverStats, _solve_by_bounded_dfs, _solve_best_first
+from .solver import ProducerIndex, _BoundedDfs, _forward_reachable, _unreachable
 from ..agents.presets import Agent
 from ..hashing import KeyGenerator
 from ..logging import Log
+from ..serialization import YamlLoader
 
 @dataclass
 class WorkflowStep:
@@ -20,14 +26,18 @@ class WorkflowStep:
     produces: list[DataInstance]
     transform: TransformInstance
     transform_library: TransformInstanceLibrary
+    depends_on: list[int]|None = None # orders of the steps whose products are used
 
     def Pack(self):
-        return dict(
+        d = dict(
             order=self.order,
             uses=[inst.Pack() for inst in self.uses],
             produces=[inst.Pack() for inst in self.produces],
             transform=f"{self.transform_library.GetKey()}::{self.transform.name}",
         )
+        if self.depends_on is not None:
+            d["depends_on"] = self.depends_on
+        return d
     
     @classmethod
     def Unpack(cls, raw: dict, libraries: dict[str, DataInstanceLibrary]):
@@ -41,8 +51,193 @@ class WorkflowStep:
             produces=[DataInstance.Unpack(inst, libraries) for inst in raw["produces"]],
             transform=tr,
             transform_library=lib,
+            depends_on=raw.get("depends_on"),
         )
 
+# content addressed plans on disk, keyed by the request and the keys of the
+# transform libraries, so that re-planning the same request skips solving
+class PlanCache:
+    _ext: str = ".yml"
+
+    def __init__(self, location: Path|str, max_size: int=64*2**20) -> None:
+        """
+        @max_size: bytes, least recently used plans are removed beyond this
+        """
+        location = Path(location).resolve()
+        location.mkdir(parents=True, exist_ok=True)
+        self.location = location
+        self.max_size = max_size
+
+    @classmethod
+    def GetRequestKey(cls, given: Iterable[DataInstance], targets: Iterable[Endpoint], **params):
+        # a cached plan refers to the libraries it was made from, which content keys alone do not tell apart
+        given = sorted(f"{inst.dtype.Signature()}/{inst._key}"+("" if inst.checksum is None else f"@{inst.parent_lib.GetKey()}") for inst in given)
+        targets = [t.Signature() for t in targets]
+        params = [f"{k}={v}" for k, v in sorted(params.items())]
+        _, k = KeyGenerator.FromStr("|".join(given+[":"]+targets+[":"]+params), l=12)
+        return k
+
+    # library keys cover only the manifests and types, so the definitions' contents are added,
+    # from checksums that are only recomputed when a file's stamp changes, without loading them
+    @classmethod
+    def GetLibraryKey(cls, transforms: Iterable[TransformInstanceLibrary]):
+        parts = []
+        for lib in transforms:
+            parts.append(lib.GetKey())
+            parts += sorted(f"{k}:{v}" for k, v in lib.Checksums().items())
+        _, k = KeyGenerator.FromStr("|".join(parts), l=12)
+        return k
+
+    def _path(self, request_key: str, library_key: str):
+        return self.location/f"{request_key}.{library_key}{self._ext}"
+
+    def Get(self, request_key: str, library_key: str) -> dict|None:
+        for p in self.location.glob(f"{request_key}.*{self._ext}"):
+            if p == self._path(request_key, library_key): continue
+            p.unlink(missing_ok=True) # planned with transform libraries that have since changed
+        path = self._path(request_key, library_key)
+        try:
+            with open(path) as f:
+                raw = yaml.load(f, Loader=YamlLoader)
+        except FileNotFoundError:
+            return None
+        os.utime(path) # mark as recently used
+        return raw
+
+    def Put(self, request_key: str, library_key: str, plan: WorkflowPlan):
+        path = self._path(request_key, library_key)
+        temp = path.with_suffix(f".{os.getpid()}.tmp")
+        plan.Save(temp)
+        temp.replace(path)
+        self._evict()
+
+    def Size(self):
+        return sum(p.stat().st_size for p in self.location.glob(f"*{self._ext}"))
+
+    def _evict(self):
+        entries = []
+        for p in self.location.glob(f"*{self._ext}"):
+            st = p.stat()
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if total <= self.max_size: break
+            p.unlink(missing_ok=True)
+            total -= size
+
+# observed durations of steps by transform, to estimate the costs of
+# transforms that do not declare them
+class StepHistory:
+    _units = dict(ms=1e-3, s=1, m=60, h=3600, d=86400)
+
+    def __init__(self, path: Path|str, window: int=20) -> None:
+        """
+        @window: estimates are the median of this many of the most recent runs
+        """
+        self.path = Path(path)
+        self.window = window
+        self.durations: dict[str, list[float]] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self.durations = yaml.load(f, Loader=YamlLoader) or {}
+
+    def GetKey(self):
+        _, k = KeyGenerator.FromStr(yaml.dump(self.durations), l=5)
+        return k
+
+    def Record(self, transform: TransformInstance, seconds: float):
+        runs = self.durations.setdefault(transform.GetKey(), [])
+        runs.append(float(seconds))
+        del runs[:-self.window]
+
+    def Duration(self, transform: TransformInstance) -> float|None:
+        runs = self.durations.get(transform.GetKey())
+        if runs is None or len(runs) == 0: return None
+        return statistics.median(runs)
+
+    # declared costs take precedence
+    def Seed(self, transform: TransformInstance, cost: TransformCost|None=None):
+        if cost is None: cost = TransformCost()
+        if cost.duration is not None: return cost
+        return replace(cost, duration=self.Duration(transform))
+
+    @classmethod
+    def _parse_duration(cls, raw: str):
+        raw = raw.strip()
+        if raw in {"", "-"}: return None
+        if raw.isdigit(): return int(raw)*cls._units["ms"] # trace.raw = true
+        total = 0.0
+        for value, unit in re.findall(r"([\d.]+)\s*(ms|s|m|h|d)", raw):
+            total += float(value)*cls._units[unit]
+        return total
+
+    # from the trace file of a nextflow run of the plan, as written with -with-trace
+    def ImportNextflowTrace(self, plan: WorkflowPlan, trace: Path|str):
+        steps = {f"{step.transform.name}__{step.transform.model.key}":step.transform for step in plan.steps}
+        recorded = 0
+        with open(trace) as f:
+            header = f.readline().rstrip("\n").split("\t")
+            for line in f:
+                row = dict(zip(header, line.rstrip("\n").split("\t")))
+                if row.get("status") != "COMPLETED": continue
+                transform = steps.get(row.get("name", "").split(" ")[0])
+                if transform is None: continue
+                seconds = self._parse_duration(row.get("realtime", row.get("duration", "")))
+                if seconds is None: continue
+                self.Record(transform, seconds)
+                recorded += 1
+        return recorded
+
+    def Save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            yaml.dump(self.durations, f)
+
+# keeps what was loaded and searched between calls to WorkflowPlan.Generate, so that
+# after a transform library changes, only the definitions that changed are loaded again
+# and only the searches that could involve them are repeated
+class PlanningSession:
+    def __init__(self, memo_limit: int|None=None) -> None:
+        """
+        @memo_limit: approximate bytes of memoized searches to keep, see SolverStats.memo_bytes
+        """
+        self.memo_limit = memo_limit
+        self._loaded: dict[Path, tuple[tuple[int, int], TransformInstance]] = {}
+        self._engines: dict[tuple, _BoundedDfs] = {}
+
+    # definitions are loaded again only if their file changed, and the same instance is kept
+    # if its key did not, since the planner compares transforms by identity
+    def IterateTransforms(self, trlib: TransformInstanceLibrary):
+        for k, v, dtype in trlib.Iterate():
+            path = trlib.location/k
+            if path.suffix != ".py": path = path.with_suffix(".py")
+            st = path.stat()
+            stamp = st.st_mtime_ns, st.st_size
+            loaded = self._loaded.get(path)
+            if loaded is None or loaded[0] != stamp:
+                tr = trlib.GetTransform(k)
+                assert tr is not None
+                if loaded is not None and loaded[1].GetKey() == tr.GetKey(): tr = loaded[1]
+                loaded = self._loaded[path] = stamp, tr
+            yield k, v, loaded[1]
+
+    # with a planner for each way of ranking plans, that is updated with the transforms
+    def Solve(self, given: Iterable[Endpoint], target: Transform, transforms: Iterable[Transform], top_k: int|None=None, stats: SolverStats|None=None, cost: PlanCost|None=None, deadline: float|None=None, max_expansions: int|None=None):
+        transforms = list(transforms)
+        k = top_k, cost.objective if cost is not None else None
+        engine = self._engines.get(k)
+        if engine is None:
+            engine = _BoundedDfs(
+                horizon=64, producers=ProducerIndex(transforms), top_k=top_k, stats=stats, cost=cost,
+                deadline=deadline, max_expansions=max_expansions, memo_limit=self.memo_limit, track=True,
+            )
+            self._engines[k] = engine
+        else:
+            changed, invalidated = engine.Update(transforms, stats=stats, cost=cost, deadline=deadline, max_expansions=max_expansions)
+            Log.Info(f"re-planning with [{len(changed)}] changed transforms, [{invalidated}] searches invalidated")
+        return engine.Solve(given, target)
+
 @dataclass
 class WorkflowPlan:
     given: list[DataInstance]
@@ -54,9 +249,44 @@ class WorkflowPlan:
         targets = [inst._key for inst in self.targets]
         steps = [step.transform.model.key for step in self.steps]
         self._hash, self._key = KeyGenerator.FromStr("".join(given+targets+steps), l=5)
+        self._link_steps()
 
     def __len__(self):
         return len(self.steps)
+
+    # for plans saved before steps recorded their dependencies
+    def _link_steps(self):
+        producer_of: dict[DataInstance, int] = {}
+        for step in self.steps:
+            if step.depends_on is None:
+                step.depends_on = sorted({producer_of[inst] for inst in step.uses if inst in producer_of})
+            for inst in step.produces:
+                producer_of[inst] = step.order
+
+    # steps grouped by the earliest they can run, each level only depends on those before it
+    def Levels(self) -> list[list[WorkflowStep]]:
+        level_of: dict[int, int] = {}
+        levels: list[list[WorkflowStep]] = []
+        for step in self.steps:
+            lv = max((level_of[o]+1 for o in step.depends_on), default=0)
+            level_of[step.order] = lv
+            if lv >= len(levels): levels.append([])
+            levels[lv].append(step)
+        return levels
+
+    def CriticalPath(self, duration: Callable[[WorkflowStep], float]|None=None) -> float:
+        """
+        @duration: of each step, or 1 to count steps
+        """
+        finish: dict[int, float] = {}
+        for step in self.steps:
+            d = duration(step) if duration is not None else 1
+            finish[step.order] = max((finish[o] for o in step.depends_on), default=0)+d
+        return max(finish.values(), default=0)
+
+    # the most steps that can run at once, if each runs as soon as its inputs are ready
+    def MaxWidth(self) -> int:
+        return max((len(lv) for lv in self.Levels()), default=0)
     
     def Pack(self):
         return dict(
@@ -80,16 +310,14 @@ class WorkflowPlan:
     @classmethod
     def Load(cls, path: Path):
         with open(path) as f:
-            raw = yaml.load(f)
+            raw = yaml.load(f, Loader=YamlLoader)
         return cls.Unpack(raw)
 
     @classmethod
-    def Generate(
-        cls,
-        given: Iterable[DataInstanceLibrary], transforms: Iterable[TransformInstanceLibrary], targets: list[Endpoint],
-    ):
+    def _index_given(cls, given: Iterable[DataInstanceLibrary], checksums: bool=False):
         given_map: dict[Endpoint, DataInstance] = {}
         for lib in given:
+            digests = lib.Checksums() if checksums else {}
             for path, ep_name, ep in lib.Iterate():
                 if ep in given_map:
                     Log.Warn(f"[{ep}] of [{lib}] is masked")
@@ -99,7 +327,89 @@ class WorkflowPlan:
                     dtype=ep,
                     dtype_name=ep_name,
                     parent_lib=lib,
+                    checksum=digests.get(path),
                 )
+        return given_map
+
+    # the same steps on other data of the same types
+    def WithGiven(self, given: Iterable[DataInstance]):
+        by_type = {inst.dtype:inst for inst in given}
+        swap: dict[DataInstance, DataInstance] = {}
+        for inst in self.given:
+            assert inst.dtype in by_type, f"no data of type [{inst.dtype_name}] given"
+            swap[inst] = by_type[inst.dtype]
+        _swap = lambda insts: [swap.get(x, x) for x in insts]
+        return WorkflowPlan(
+            given=_swap(self.given),
+            targets=_swap(self.targets),
+            steps=[replace(step, uses=_swap(step.uses), produces=_swap(step.produces), depends_on=list(step.depends_on)) for step in self.steps],
+        )
+
+    @classmethod
+    def GenerateBatch(
+        cls,
+        requests: Iterable[tuple[Iterable[DataInstanceLibrary], list[Endpoint]]], transforms: Iterable[TransformInstanceLibrary],
+        **kwargs,
+    ) -> list[WorkflowPlan]:
+        """
+        plans each distinct set of given types and targets once, then
+        reuses that plan for every request with the same types
+        @requests: (given, targets) as for Generate
+        @kwargs: passed to Generate
+        """
+        transforms = list(transforms)
+        templates: dict[str, WorkflowPlan] = {}
+        plans: list[WorkflowPlan] = []
+        for given, targets in requests:
+            given = list(given)
+            given_map = cls._index_given(given, checksums=kwargs.get("checksums", False))
+            signature = "|".join(sorted(e.key for e in given_map))+":"+"|".join(t.key for t in targets)
+            if signature in templates:
+                plans.append(templates[signature].WithGiven(given_map.values()))
+                continue
+            plan = cls.Generate(given, transforms, targets, **kwargs)
+            templates[signature] = plan
+            plans.append(plan)
+        Log.Info(f"planned [{len(plans)}] requests with [{len(templates)}] searches")
+        return plans
+
+    @classmethod
+    def Generate(
+        cls,
+        given: Iterable[DataInstanceLibrary], transforms: Iterable[TransformInstanceLibrary], targets: list[Endpoint],
+        mode: PlanningMode|str=PlanningMode.DFS, top_k: int|None=None,
+        cache: PlanCache|None=None, stats: SolverStats|None=None,
+        objective: PlanObjective|str=PlanObjective.STEPS, history: StepHistory|None=None,
+        deadline: float|None=None, max_expansions: int|None=None,
+        memo_limit: int|None=None, workers: int|None=None,
+        session: PlanningSession|None=None, checksums: bool=False,
+    ):
+        """
+        @objective: minimize steps, or total cost or makespan from the transforms' declared costs
+        @history: estimates durations of transforms that do not declare them
+        @deadline: seconds to search, after which the best plan found so far is used
+        @max_expansions: likewise, a limit on the number of subproblems searched
+        @memo_limit: approximate bytes of memoized searches to keep, unbounded if None
+        @workers: processes to search the targets, or a single target's requirements, in parallel, for the DFS mode
+        @session: keeps loaded transforms and, in DFS mode, searches for the next call, instead of memo_limit and workers
+        @checksums: key the given data by content, so that cached plans are not reused once it changes
+        """
+        mode = PlanningMode(mode)
+        objective = PlanObjective(objective)
+        given, transforms = list(given), list(transforms)
+        given_map = cls._index_given(given, checksums=checksums)
+
+        if cache is not None:
+            params = dict(mode=mode.value, top_k=top_k)
+            if objective != PlanObjective.STEPS:
+                params.update(objective=objective.value, history=history.GetKey() if history is not None else None)
+            request_key = cache.GetRequestKey(given_map.values(), targets, **params)
+            library_key = cache.GetLibraryKey(transforms)
+            raw = cache.Get(request_key, library_key)
+            if raw is not None:
+                Log.Info(f"using cached plan [{request_key}]")
+                libraries = {lib.GetKey():lib for lib in given+transforms}
+                return cls.Unpack(raw, libraries)
 
         target_e2d: dict[Endpoint, Dependency] = {}
         target_model = Transform()
@@ -109,7 +419,7 @@ class WorkflowPlan:
         transform2inst: dict[Transform, TransformInstance] = {}
         inst2trlib: dict[TransformInstance, TransformInstanceLibrary] = {}
         for trlib in transforms:
-            for path, name, tr in trlib.IterateTransforms():
+            for path, name, tr in (trlib.IterateTransforms() if session is None else session.IterateTransforms(trlib)):
                 model = tr.model
                 if model in transform2inst:
                     Log.Warn(f"transform [{model}] of [{trlib}] is masked")
@@ -117,17 +427,71 @@ class WorkflowPlan:
                 transform2inst[model] = tr
                 inst2trlib[tr] = trlib
 
-        solutions = _solve_by_bounded_dfs(
-            given=given_map.keys(),
-            target=target_model,
-            transforms=transform2inst.keys(),
-        )
+        # fail fast, instead of searching to the horizon
+        available, reachable = _forward_reachable(given_map.keys(), transform2inst.keys())
+        missing = set(_unreachable(available, target_model))
+        assert len(missing) == 0, f"no transforms can make targets {[e for e, d in target_e2d.items() if d in missing]} from the given data"
+        if stats is None: stats = SolverStats()
+        stats.pruned_transforms += len(transform2inst)-len(reachable)
+
+        cost = None
+        if objective != PlanObjective.STEPS:
+            weights = {}
+            for model, inst in transform2inst.items():
+                c = inst.cost if history is None else history.Seed(inst, inst.cost)
+                weights[model] = c.Weight(objective) if c is not None else None
+            cost = PlanCost(weights, objective)
 
+        if mode == PlanningMode.BEST_FIRST:
+            # stops at the shortest plan instead of enumerating all of them
+            solutions = _solve_best_first(
+                given=given_map.keys(),
+                target=target_model,
+                transforms=reachable,
+                stats=stats,
+                prune=False,
+                cost=cost,
+                deadline=deadline,
+                max_expansions=max_expansions,
+                memo_limit=memo_limit,
+            )
+        elif session is not None:
+            solutions = session.Solve(
+                given=given_map.keys(),
+                target=target_model,
+                transforms=reachable,
+                top_k=top_k,
+                stats=stats,
+                cost=cost,
+                deadline=deadline,
+                max_expansions=max_expansions,
+            )
+        else:
+            solutions = _solve_by_bounded_dfs(
+                given=given_map.keys(),
+                target=target_model,
+                transforms=reachable,
+                top_k=top_k,
+                stats=stats,
+                prune=False,
+                cost=cost,
+                deadline=deadline,
+                max_expansions=max_expansions,
+                memo_limit=memo_limit,
+                workers=workers,
+            )
+
+        if stats.timed_out:
+            assert len(solutions) > 0, f"failed to make plan in time, after [{stats.expanded}] expansions"
+            Log.Warn(f"out of time after [{stats.expanded}] expansions, the plan may not be the best")
         assert len(solutions) > 0, "failed to make plan!"
         solution = solutions[0]
 
         _instance_map: dict[Endpoint, DataInstance] = given_map.copy()
         steps: list[WorkflowStep] = []
+        depends_on: dict[int, list[int]] = {}
+        for i, j in solution.Edges():
+            depends_on.setdefault(j, []).append(i+1)
         for i, appl in enumerate(solution.dependency_plan):
             tr = transform2inst[appl.transform]
             _lib = inst2trlib[tr]
@@ -148,6 +512,7 @@ class WorkflowPlan:
                 produces=[_instance_map[e] for e in appl.produced],
                 transform=tr,
                 transform_library=_lib,
+                depends_on=depends_on.get(i, []),
             )
             steps.append(step)
 
@@ -159,11 +524,15 @@ class WorkflowPlan:
             _inst = _instance_map[_appl_e]
             _sol_target_instances.append(_inst)
 
-        return cls(
+        plan = cls(
             given=list(given_map.values()),
             targets=_sol_target_instances,
             steps=steps,
         )
+        Log.Info(f"planned [{len(plan)}] steps, critical path of [{plan.CriticalPath():g}], up to [{plan.MaxWidth()}] at once")
+        if cache is not None and not stats.timed_out:
+            cache.Put(request_key, library_key, plan)
+        return plan
     
     def PrepareNextflow(self, work_dir: Path, external_work: Path):
         TAB = " "*4
@@ -288,9 +657,9 @@ class WorkflowTask:
     def Load(cls, path: Path|str):
         path = Path(path)
         with open(path/"task.yml") as f:
-            raw_task = yaml.safe_load(f)
+            raw_task = yaml.load(f, Loader=YamlLoader)
         with open(path/"plan.yml") as f:
-            raw_plan = yaml.safe_load(f)
+            raw_plan = yaml.load(f, Loader=YamlLoader)
         
         data_libs = {n: DataInstanceLibrary.Load(path/f"data/{n}") for n in raw_task["data_libraries"]}
         tr_libs = {n: TransformInstanceLibrary.Load(path/f"transforms/{n}") for n in raw_task["transform_libraries"]}
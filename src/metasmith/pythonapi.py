@@ -1,5 +1,5 @@
 from .models.libraries import Endpoint, DataTypeLibrary
 from .models.libraries import DataInstanceLibrary
-from .models.libraries import Transform, TransformInstance, TransformInstanceLibrary
+from .models.libraries import Transform, TransformInstance, TransformInstanceLibrary, TransformCost
 from .models.libraries import ExecutionContext, ExecutionResult
 from.logging import Log
@@ -1,7 +1,11 @@
 from __future__ import annotations
 import time
+import yaml
 from datetime import datetime as dt
 
+# the libyaml parser, if PyYAML was built with it, is several times faster
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 class StdTime:
     FORMAT = '%Y-%m-%d_%H-%M-%S'
 